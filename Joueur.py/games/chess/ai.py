@@ -1,14 +1,24 @@
 # This is where you build your AI for the Chess game.
 
+import os
 import random
+import threading
 from time import sleep
 
 # local imports
 from joueur.base_ai import BaseAI
 from games.chess.engine import Chess
+from games.chess.book import Book
+from games.chess.pns import ProofNumberSearch
+from games.chess.mcts import MonteCarloTreeSearch
+from games.chess.constants import *
 
 # <<-- Creer-Merge: imports -->> - Code you add between this comment and the end comment will be preserved between Creer re-runs.
 # you can add additional import(s) here
+
+
+class SearchInterrupted(Exception):
+    """Raised inside minimax when a background search has to stop."""
 # <<-- /Creer-Merge: imports -->>
 
 class AI(BaseAI):
@@ -31,12 +41,71 @@ class AI(BaseAI):
         
         # our local board representation
         self.chess = Chess(self.game.fen)
+        # how many of game.moves are already played on it
+        self.synced_moves = len(self.game.moves)
+
+        # e.g. --aiSettings move_window=16 keeps only the last 16 Move objects,
+        # with older moves packed, for long games
+        if self.get_setting("move_window"):
+            self.game.keep_moves(int(self.get_setting("move_window")))
 
         # represents whether or not we want minimax to return high or low
         self.color_code = 1 if self.player.color == "White" else -1
 
-        # depth limit
-        self.depth_limit = int(self.get_setting("depth_limit"))
+        # depth limit, e.g. --aiSettings depth_limit=5, 3 plies when not given
+        self.depth_limit = int(self.get_setting("depth_limit") or 3)
+
+        # e.g. --aiSettings seed=1 picks the same moves every game, so a
+        # recorded session replays the same way (with ponder_replies=0)
+        if self.get_setting("seed"):
+            random.seed(self.get_setting("seed"))
+
+        # optional Polyglot opening book, e.g. --aiSettings book=book.bin
+        self.book = Book(self.get_setting("book")) if self.get_setting("book") else None
+        self.book_weighted = self.get_setting("book_selection") != "best"
+
+        # optional endgame bitbases, e.g. --aiSettings bitbases=bitbases
+        self.bitbases = None
+        if self.get_setting("bitbases"):
+            # imported here, the package importing it would trip up running
+            # the generator with python -m games.chess.bitbase
+            from games.chess.bitbase import Bitbases
+            self.bitbases = Bitbases(self.get_setting("bitbases"))
+
+        # --aiSettings mate_solver=pns tries a proof-number mate search first when
+        # we're well ahead, bounded by a node table size, a mate length in plies
+        # and a time limit in seconds
+        self.mate_solver = None
+        if self.get_setting("mate_solver") == "pns":
+            self.mate_solver = ProofNumberSearch(
+                int(self.get_setting("pns_nodes") or 2000),
+                int(self.get_setting("pns_plies") or 5),
+                float(self.get_setting("pns_time") or 1))
+
+        # --aiSettings engine=mcts swaps minimax for Monte Carlo tree search
+        self.mcts = None
+        if self.get_setting("engine") == "mcts":
+            self.mcts = MonteCarloTreeSearch(
+                int(self.get_setting("mcts_processes") or os.cpu_count() or 1),
+                int(self.get_setting("mcts_plies") or 8))
+            self.move_time = float(self.get_setting("move_time") or 5)
+
+        # search state kept across turns: transposition table entries are
+        # (depth, value, flag, best move key, age), killers are per ply
+        self.table = {}
+        self.age = 0
+        self.killers = [[] for _ in range(self.depth_limit + 2)]
+        self.history_scores = {}
+        self.pv = []
+
+        # our best answers to the opponent's likeliest replies, searched on
+        # their time and keyed by the position after the reply
+        self.ponder_replies = int(self.get_setting("ponder_replies") or 3)
+        self.replies = {}
+        self.ponder_thread = None
+        self.interrupted = threading.Event()
+        self.cancelled = False
+        self.turn_lock = threading.Lock()
 
         # <<-- /Creer-Merge: start -->>
 
@@ -55,7 +124,22 @@ class AI(BaseAI):
             reason (str): The human readable string explaining why you won or lost.
         """
         # <<-- Creer-Merge: end -->> - Code you add between this comment and the end comment will be preserved between Creer re-runs.
-        # replace with your end logic
+        # a cancelled turn that hasn't stopped yet may still be reading the
+        # book and bitbases or waiting on the pool, so those are left for the
+        # process exiting to clean up
+        if not self.turn_lock.acquire(blocking=False):
+            return
+
+        try:
+            self.stop_pondering()
+            if self.book:
+                self.book.close()
+            if self.bitbases:
+                self.bitbases.close()
+            if self.mcts:
+                self.mcts.close()
+        finally:
+            self.turn_lock.release()
         # <<-- /Creer-Merge: end -->>
     def run_turn(self):
         """ This is called every time it is this AI.player's turn.
@@ -65,79 +149,350 @@ class AI(BaseAI):
         """
         # <<-- Creer-Merge: runTurn -->> - Code you add between this comment and the end comment will be preserved between Creer re-runs.
 
-        if len(self.game.moves) > 0:
-            self.update_last_move()
+        # end() takes this too, so it never closes what a turn is still using
+        with self.turn_lock:
+            self.stop_pondering()
 
-        move = self.minimax_root(self.depth_limit, self.chess, True)
-        self.chess.move(move)
-        
-        print("Best move: {}".format(move))
-        self.chess.print()
-        print()
-        
-        promotion = '' if not move.promotion else Chess.PIECE_MAP[self.chess.board[move.m_to].type]
+            self.sync_moves()
+
+            self.age_search_state()
+
+            try:
+                move = self.choose_move()
+            except SearchInterrupted:
+                # the game ended while we were still thinking
+                return True
+
+            self.chess.move(move)
+            # our own move is already on the board when the server echoes it back
+            self.synced_moves += 1
+
+            print("Best move: {}".format(move))
+            self.chess.print()
+            print()
+
+            promotion = '' if not move.promotion else Chess.PIECE_MAP[self.chess.board[move.m_to].type]
+
+            m_from = Chess.get_san(move.m_from)
+            m_to = Chess.get_san(move.m_to)
+            piece = self.game.get_piece_at(m_from[0], int(m_from[1]))
+            piece.move(m_to[0], int(m_to[1]), promotionType=promotion)
 
-        for piece in self.player.pieces:
-            if ''.join((piece.file, str(piece.rank))) == Chess.get_san(move.m_from):
-                piece.move(*tuple(Chess.get_san(move.m_to)), promotionType=promotion)
+            self.start_pondering()
 
-        return True  # to signify we are done with our turn.
+            return True  # to signify we are done with our turn.
 
         # <<-- /Creer-Merge: runTurn -->>
 
     # <<-- Creer-Merge: functions -->> - Code you add between this comment and the end comment will be preserved between Creer re-runs.
 
-    def update_last_move(self):
-        move = self.game.moves[-1]
-        fr_from = move.from_file + str(move.from_rank)
-        fr_to = move.to_file + str(move.to_rank)
-        self.chess.move(self.chess.get_enemy_move(fr_from, fr_to))
+    # what run_turn reads every turn; everything else (move history, logs,
+    # the game's piece list) is only merged if something reads it
+    delta_subscriptions = {
+        'Game': ['fen', 'current_player', 'current_turn', 'players'],
+        'Player': ['color', 'pieces', 'time_remaining', 'in_check',
+                   'won', 'lost', 'reason_won', 'reason_lost', 'opponent'],
+        'Piece': ['file', 'rank', 'type', 'owner', 'captured', 'has_moved'],
+        'GameObject': [],
+        'Move': []
+    }
+
+    def choose_move(self):
+        move = self.pondered_move()
+        if not move:
+            move = self.book_move()
+        if not move and self.mate_solver and self.mate_likely():
+            move = self.mate_solver.find_mate(self.chess, self.interrupted)
+        if not move and self.mcts:
+            move = self.mcts.search(self.chess, self.move_time, self.interrupted)
+        if not move:
+            move = self.minimax_root(self.depth_limit, self.chess, True)
+
+        return move
+
+    def cancel(self):
+        # the client calls this from its own thread when the game is over mid-turn
+        self.cancelled = True
+        self.interrupted.set()
+
+    def sync_moves(self):
+        # play the moves made since we last looked, normally just the opponent's
+        for move in self.game.iter_moves(self.synced_moves):
+            self.chess.move(self.chess.build_move(
+                Chess.get_square(move.from_file, move.from_rank),
+                Chess.get_square(move.to_file, move.to_rank),
+                Chess.PIECE_TYPES.get(move.promotion, '')))
+            self.synced_moves += 1
+
+    def book_move(self):
+        if not self.book:
+            return None
+
+        move = self.book.find_move(self.chess, self.book_weighted)
+
+        # once we're out of book we're very unlikely to transpose back in
+        if not move:
+            self.book.close()
+            self.book = None
+
+        return move
+
+    def mate_likely(self):
+        # a material lead and several checks to choose from are worth a mate
+        # search, the lead is checked first as it's free
+        if self.chess.value * self.color_code < PNS_MATERIAL_MARGIN:
+            return False
+
+        checks = 0
+        for move in self.chess.status().moves:
+            self.chess.move(move)
+            checks += self.chess.in_check()
+            self.chess.undo()
+
+        return checks >= PNS_MIN_CHECKS
+
+    def pondered_move(self):
+        table_move = self.replies.get(self.chess.key)
+        self.replies = {}
+
+        return next((move for move in self.chess.status().moves
+                     if Chess.get_move_key(move) == table_move), None)
+
+    def start_pondering(self):
+        if not self.ponder_replies or self.mcts or self.chess.game_over():
+            return
+
+        # the thread gets its own board, with the key stack for repetitions
+        chess = Chess(self.chess.generate_fen())
+        chess.keys = list(self.chess.keys)
+
+        self.ponder_thread = threading.Thread(target=self.ponder, args=(chess,), daemon=True)
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        if not self.ponder_thread:
+            return
+
+        self.interrupted.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+
+        # a cancelled turn has to stay interrupted
+        if not self.cancelled:
+            self.interrupted.clear()
+
+    def ponder(self, chess):
+        # the real search owns the ply-indexed killers and the pv
+        killers, pv = self.killers, self.pv
+        self.killers = [[] for _ in killers]
+        self.pv = []
+
+        try:
+            for reply in self.likely_replies(chess):
+                chess.move(reply)
+
+                if not chess.game_over():
+                    move = self.minimax_root(self.depth_limit, chess, True)
+                    self.replies[chess.key] = Chess.get_move_key(move)
+
+                chess.undo()
+        except SearchInterrupted:
+            pass
+        finally:
+            self.killers, self.pv = killers, pv
+
+    def likely_replies(self, chess):
+        # the opponent's moves that look best for them after one ply
+        scored = []
+        for move in chess.status().moves:
+            chess.move(move)
+            scored.append((-chess.evaluate() * self.color_code, move))
+            chess.undo()
+
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [move for _, move in scored[:self.ponder_replies]]
+
+    def age_search_state(self):
+        # called once per turn: keep what the last search learned, minus what went stale
+        self.age += 1
+        self.table = {key: entry for key, entry in self.table.items()
+                      if entry[4] > self.age - SEARCH_MAX_AGE}
+
+        # our move and the reply were played, so two plies down is the new root
+        self.killers = self.killers[2:] + [[], []]
+        self.history_scores = {key: score // 2 for key, score in self.history_scores.items() if score > 1}
+
+        last = Chess.get_move_key(self.chess.history[-1][1]) if self.chess.history else None
+        self.pv = self.pv[2:] if len(self.pv) > 2 and self.pv[1] == last else []
+
+    def order_moves(self, moves, depth, table_move):
+        ply = self.depth_limit - depth
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        pv_move = self.pv[ply] if ply < len(self.pv) else None
+
+        def score(move):
+            key = Chess.get_move_key(move)
+
+            if key == table_move:
+                return 4000000
+            if key == pv_move:
+                return 3000000
+            # most valuable victim, least valuable attacker
+            if move.captured:
+                return (2000000 + 10 * Chess.PIECE_VALUES[WHITE][move.captured] -
+                        Chess.PIECE_VALUES[WHITE][move.piece])
+            if key in killers:
+                return 1000000
+
+            return self.history_scores.get(key, 0)
+
+        # shuffle first so equally ordered moves still vary between games
+        random.shuffle(moves)
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def record_cutoff(self, move, depth):
+        if move.captured:
+            return
+
+        key = Chess.get_move_key(move)
+        ply = self.depth_limit - depth
+
+        if ply < len(self.killers) and key not in self.killers[ply]:
+            self.killers[ply] = [key] + self.killers[ply][:1]
+
+        self.history_scores[key] = self.history_scores.get(key, 0) + depth * depth
+
+    def store(self, game, depth, value, flag, move):
+        entry = self.table.get(game.key)
+
+        # keep deeper results from this turn over shallower ones
+        if entry and entry[4] == self.age and entry[0] > depth:
+            return
+
+        self.table[game.key] = (depth, value, flag, move and Chess.get_move_key(move), self.age)
+
+    def principal_variation(self, game, depth):
+        pv = []
+
+        for _ in range(depth):
+            entry = self.table.get(game.key)
+            move = entry and next((move for move in game.status().moves
+                                   if Chess.get_move_key(move) == entry[3]), None)
+            if not move:
+                break
+
+            pv.append(entry[3])
+            game.move(move)
+
+        for _ in pv:
+            game.undo()
+
+        return pv
 
     def minimax_root(self, depth, game, is_max_player):
-        moves = game.generate_moves()
-        random.shuffle(moves)
+        entry = self.table.get(game.key)
+        moves = self.order_moves(list(game.status().moves), depth, entry and entry[3])
+        alpha = -float('inf')
         best_value = -9999
         best_move = None
 
         for move in moves:
             game.move(move)
-            value = self.minimax(depth-1, game, not is_max_player)
+            value = self.minimax(depth-1, game, not is_max_player, alpha, float('inf'))
             game.undo()
 
-            if value >= best_value:
+            if best_move is None or value > best_value:
                 best_value = value
                 best_move = move
+                alpha = max(alpha, value)
+
+        self.store(game, depth, best_value, TT_EXACT, best_move)
+        self.pv = self.principal_variation(game, depth)
 
         return best_move
 
-    def minimax(self, depth, game, is_max_player):
+    def minimax(self, depth, game, is_max_player, alpha, beta):
+        if self.interrupted.is_set():
+            raise SearchInterrupted()
+
+        # a repetition or the 50 move rule draws even a won ending, and the
+        # bitbases can't know about either, so these come first
+        if game.half_moves >= 100 or game.in_threefold_repetition():
+            return 0
+
+        if self.bitbases:
+            result = self.bitbases.probe(game)
+
+            # known result, with the evaluation steering the winner towards mate
+            if result is not None:
+                return (result * BITBASE_WIN + game.evaluate()) * self.color_code if result else 0
+
         if not depth:
-            return game.value * self.color_code
+            return game.evaluate() * self.color_code
 
-        if game.in_draw():
+        status = game.status()
+        if status.draw:
             return 0
 
-        moves = game.generate_moves()
-        random.shuffle(moves)
+        # a result from this or an earlier turn may already settle this node
+        table_move = None
+        entry = self.table.get(game.key)
+        if entry:
+            entry_depth, value, flag, table_move, _ = entry
+
+            if entry_depth >= depth:
+                if (flag == TT_EXACT or
+                        (flag == TT_LOWER and value >= beta) or
+                        (flag == TT_UPPER and value <= alpha)):
+                    return value
+
+        original_alpha, original_beta = alpha, beta
+        moves = self.order_moves(list(status.moves), depth, table_move)
+        best_move = None
 
         if is_max_player:
             best_value = -9999
 
             for move in moves:
                 game.move(move)
-                best_value = max(best_value, self.minimax(depth-1, game, not is_max_player))
+                value = self.minimax(depth-1, game, not is_max_player, alpha, beta)
                 game.undo()
 
-            return best_value
+                if value > best_value:
+                    best_value = value
+                    best_move = move
+
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    self.record_cutoff(move, depth)
+                    break
         else:
             best_value = 9999
 
             for move in moves:
                 game.move(move)
-                best_value = min(best_value, self.minimax(depth-1, game, not is_max_player))
+                value = self.minimax(depth-1, game, not is_max_player, alpha, beta)
                 game.undo()
 
-            return best_value
+                if value < best_value:
+                    best_value = value
+                    best_move = move
+
+                beta = min(beta, value)
+                if alpha >= beta:
+                    self.record_cutoff(move, depth)
+                    break
+
+        flag = TT_EXACT
+        if best_value <= original_alpha:
+            flag = TT_UPPER
+        elif best_value >= original_beta:
+            flag = TT_LOWER
+
+        self.store(game, depth, best_value, flag, best_move)
+
+        return best_value
 
     def print_current_board(self):
         """Prints the current board using pretty ASCII art
@@ -159,12 +514,7 @@ class AI(BaseAI):
                 for file_offset in range(0, 8):
                     # start at a, with with file offset increasing the char
                     f = chr(ord("a") + file_offset)
-                    current_piece = None
-                    for piece in self.game.pieces:
-                        if piece.file == f and piece.rank == r:
-                            # then we found the piece at (file, rank)
-                            current_piece = piece
-                            break
+                    current_piece = self.game.get_piece_at(f, r)
 
                     code = "."  # default "no piece"
                     if current_piece:
@@ -0,0 +1,291 @@
+# Endgame bitbases for king and one piece against a lone king.
+#
+# Tables are built by retrograde analysis on top of the Chess move generator
+# and stored as packed bit arrays, one bit per position, set when the side
+# with the extra piece wins with best play. Every other position is a draw.
+#
+# Generate them from the Joueur.py directory with:
+#     python3 -m games.chess.bitbase -o bitbases KQK KRK KPK
+
+import argparse
+import mmap
+import os
+from array import array
+
+# local imports
+from games.chess.constants import *
+from games.chess.engine import Chess
+
+# the tables we know how to build, keyed by the extra piece's type
+MATERIALS = {"KQK": QUEEN, "KRK": ROOK, "KPK": PAWN}
+
+MAGIC = b"JBB1"
+HEADER_SIZE = 8
+
+# side to move * white king * black king * piece, 64 squares each
+POSITIONS = 2 * 64 * 64 * 64
+
+# outcomes of child positions that fall outside the table being built
+CHILD_DRAW = -1
+CHILD_WIN = -2
+
+
+def square_64(square):
+    return Chess.get_rank(square) * 8 + Chess.get_file(square)
+
+
+def square_0x88(square):
+    return (square >> 3) * 16 + (square & 7)
+
+
+def get_index(black_to_move, white_king, black_king, piece):
+    # squares are 0..63, a8 first, as in the 0x88 layout
+    return ((black_to_move * 64 + white_king) * 64 + black_king) * 64 + piece
+
+
+def get_fen(black_to_move, white_king, black_king, piece, type):
+    rows = [['1'] * 8 for _ in range(8)]
+    rows[white_king >> 3][white_king & 7] = 'K'
+    rows[black_king >> 3][black_king & 7] = 'k'
+    rows[piece >> 3][piece & 7] = type.upper()
+
+    placement = '/'.join(''.join(row) for row in rows)
+    return "{} {} - - 0 1".format(placement, BLACK if black_to_move else WHITE)
+
+
+def is_legal_setup(black_to_move, white_king, black_king, piece, type):
+    if len({white_king, black_king, piece}) < 3:
+        return False
+
+    # kings can never stand next to each other
+    if (abs((white_king >> 3) - (black_king >> 3)) <= 1 and
+            abs((white_king & 7) - (black_king & 7)) <= 1):
+        return False
+
+    # pawns never stand on the first or last rank
+    if type == PAWN and piece >> 3 in [0, 7]:
+        return False
+
+    return True
+
+
+def get_children(chess, black_to_move, white_king, black_king, piece, known):
+    children = array('l')
+
+    for move in chess.generate_moves():
+        m_to = square_64(move.m_to)
+
+        if black_to_move:
+            # the lone king takes the piece and the game is drawn
+            if m_to == piece:
+                children.append(CHILD_DRAW)
+            else:
+                children.append(get_index(0, white_king, m_to, piece))
+        elif move.promotion:
+            table = known.get("K{}K".format(move.promotion.upper()))
+
+            if table is None:
+                children.append(CHILD_DRAW)
+            else:
+                won = probe_bits(table, get_index(1, white_king, black_king, m_to))
+                children.append(CHILD_WIN if won else CHILD_DRAW)
+        elif square_64(move.m_from) == white_king:
+            children.append(get_index(1, m_to, black_king, piece))
+        else:
+            children.append(get_index(1, white_king, black_king, m_to))
+
+    return children
+
+
+def generate(material, known=None):
+    """Builds the bitbase for material (e.g. "KQK") and returns its packed bits.
+
+    Args:
+        material (str): One of MATERIALS.
+        known (dict[str, bytearray]): Already built tables, used to score pawn promotions.
+
+    Returns:
+        bytearray: One bit per position index, set when white wins.
+    """
+    known = known or {}
+    type = MATERIALS[material]
+    wins = bytearray(POSITIONS)
+    pending = {0: [], 1: []}
+
+    for index in range(POSITIONS):
+        piece = index & 63
+        black_king = (index >> 6) & 63
+        white_king = (index >> 12) & 63
+        black_to_move = index >> 18
+
+        if not is_legal_setup(black_to_move, white_king, black_king, piece, type):
+            continue
+
+        chess = Chess(get_fen(black_to_move, white_king, black_king, piece, type))
+
+        # the side that just moved can't be left in check
+        if chess.king_attacked(Chess.swap_color(chess.turn)):
+            continue
+
+        children = get_children(chess, black_to_move, white_king, black_king, piece, known)
+
+        if black_to_move and not children:
+            # checkmate wins, stalemate draws
+            wins[index] = 1 if chess.in_check() else 0
+        elif children:
+            pending[black_to_move].append((index, children))
+
+    # keep resolving positions until nothing changes
+    changed = True
+    while changed:
+        changed = False
+
+        unresolved = []
+        for index, children in pending[0]:
+            if any(child == CHILD_WIN or (child >= 0 and wins[child]) for child in children):
+                wins[index] = 1
+                changed = True
+            else:
+                unresolved.append((index, children))
+        pending[0] = unresolved
+
+        unresolved = []
+        for index, children in pending[1]:
+            if all(child == CHILD_WIN or (child >= 0 and wins[child]) for child in children):
+                wins[index] = 1
+                changed = True
+            else:
+                unresolved.append((index, children))
+        pending[1] = unresolved
+
+    return pack(wins)
+
+
+def pack(wins):
+    bits = bytearray(POSITIONS // 8)
+
+    for index, won in enumerate(wins):
+        if won:
+            bits[index >> 3] |= 1 << (index & 7)
+
+    return bits
+
+
+def probe_bits(bits, index, offset=0):
+    return (bits[offset + (index >> 3)] >> (index & 7)) & 1
+
+
+def save(path, material, bits):
+    with open(path, "wb") as file:
+        file.write(MAGIC + material.encode("ascii").ljust(HEADER_SIZE - len(MAGIC)))
+        file.write(bits)
+
+
+def load(path):
+    with open(path, "rb") as file:
+        return bytearray(file.read()[HEADER_SIZE:])
+
+
+class Bitbases:
+    """Memory-mapped bitbases, probed in O(1) during search."""
+
+    def __init__(self, directory):
+        self.files = []
+        self.tables = {}
+
+        for material, type in MATERIALS.items():
+            path = os.path.join(directory, material + ".bin")
+
+            if not os.path.isfile(path):
+                continue
+
+            file = open(path, "rb")
+            table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            if table[:len(MAGIC)] != MAGIC:
+                table.close()
+                file.close()
+                continue
+
+            self.files.append(file)
+            self.tables[type] = table
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        for file in self.files:
+            file.close()
+
+        self.tables = {}
+        self.files = []
+
+    def probe(self, chess):
+        """Looks up the current position.
+
+        Returns:
+            int: 1 if white wins, -1 if black wins, 0 for a draw, or None if no table covers it.
+        """
+        white = chess.material[WHITE]
+        black = chess.material[BLACK]
+
+        # only king and one piece against a lone king
+        if sum(white.values()) + sum(black.values()) != 3:
+            return None
+
+        strong = WHITE if sum(white.values()) == 2 else BLACK
+        type = next(type for type, count in chess.material[strong].items()
+                    if count and type != KING)
+        table = self.tables.get(type)
+
+        if table is None:
+            return None
+
+        piece = next(square for square in BOARD_SQUARES
+                     if chess.board[square] and chess.board[square].type == type)
+
+        white_king = square_64(chess.kings[strong])
+        black_king = square_64(chess.kings[Chess.swap_color(strong)])
+        piece = square_64(piece)
+        black_to_move = 0 if chess.turn == strong else 1
+
+        # tables are built with white as the strong side, so flip the board for black
+        if strong == BLACK:
+            white_king ^= 56
+            black_king ^= 56
+            piece ^= 56
+
+        index = get_index(black_to_move, white_king, black_king, piece)
+
+        if not probe_bits(table, index, HEADER_SIZE):
+            return 0
+
+        return 1 if strong == WHITE else -1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates endgame bitbases.')
+    parser.add_argument('materials', nargs='*', default=list(MATERIALS), help='the tables to build, e.g. KQK KRK KPK')
+    parser.add_argument('-o, --output', action='store', dest='output', default='bitbases', help='the directory to write the tables to')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+
+    # pawn tables need the tables for the pieces they can promote to
+    materials = sorted(args.materials, key=lambda material: MATERIALS[material] == PAWN)
+    known = {}
+
+    for material in materials:
+        for promoted in ["KQK", "KRK"]:
+            path = os.path.join(args.output, promoted + ".bin")
+
+            if promoted not in known and os.path.isfile(path):
+                known[promoted] = load(path)
+
+        print("Generating {}...".format(material))
+        bits = generate(material, known)
+        save(os.path.join(args.output, material + ".bin"), material, bits)
+        known[material] = bits
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import mmap
+import os
+import random
+import struct
+
+# local imports
+from games.chess.constants import *
+from games.chess.engine import Chess
+
+
+class Book:
+    """A Polyglot (.bin) opening book, memory mapped and probed by binary search.
+
+    Every entry is 16 big-endian bytes: a 64 bit position key, a 16 bit move,
+    a 16 bit weight and a 32 bit learn value, sorted by key. Positions are
+    looked up with Chess.key, which uses the Polyglot key layout.
+    """
+
+    ENTRY = struct.Struct(">QHHI")
+    KEY = struct.Struct(">Q")
+
+    PROMOTIONS = {1: KNIGHT, 2: BISHOP, 3: ROOK, 4: QUEEN}
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.entries = os.fstat(self.file.fileno()).st_size // Book.ENTRY.size
+
+        # mmap refuses empty files
+        self.map = None
+        if self.entries:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self.map:
+            self.map.close()
+            self.map = None
+
+        self.file.close()
+
+    def key_at(self, index):
+        return Book.KEY.unpack_from(self.map, index * Book.ENTRY.size)[0]
+
+    def probe(self, key):
+        # binary search for the first entry with this key
+        low, high = 0, self.entries
+        while low < high:
+            mid = (low + high) // 2
+
+            if self.key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        entries = []
+        while low < self.entries:
+            entry_key, move, weight, _ = Book.ENTRY.unpack_from(self.map, low * Book.ENTRY.size)
+
+            if entry_key != key:
+                break
+
+            entries.append((move, weight))
+            low += 1
+
+        return entries
+
+    def find_move(self, chess, weighted=True):
+        # returns a legal Move from the book for this position, or None
+        if not self.map:
+            return None
+
+        candidates = []
+        legal = chess.status().moves
+
+        for book_move, weight in self.probe(chess.key):
+            move = Book.decode(chess, book_move, legal)
+
+            if move and weight:
+                candidates.append((move, weight))
+
+        if not candidates:
+            return None
+
+        if not weighted:
+            return max(candidates, key=lambda candidate: candidate[1])[0]
+
+        pick = random.randrange(sum(weight for _, weight in candidates))
+        for move, weight in candidates:
+            pick -= weight
+
+            if pick < 0:
+                return move
+
+    @staticmethod
+    def decode(chess, book_move, legal):
+        # Polyglot squares are 6 bits: row (0 = rank 1) and file (0 = a)
+        m_to = (7 - ((book_move >> 3) & 7)) * 16 + (book_move & 7)
+        m_from = (7 - ((book_move >> 9) & 7)) * 16 + ((book_move >> 6) & 7)
+        promotion = Book.PROMOTIONS.get((book_move >> 12) & 7, '')
+
+        # castling is stored as the king capturing its own rook
+        piece = chess.board[m_from]
+        if piece and piece.type == KING and abs(Chess.get_file(m_to) - Chess.get_file(m_from)) > 1:
+            m_to = m_from + (2 if m_to > m_from else -2)
+
+        for move in legal:
+            if (move.m_from == m_from and move.m_to == m_to and
+                    move.promotion == promotion):
+                return move
+
+        return None
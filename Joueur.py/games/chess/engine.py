@@ -16,6 +16,9 @@ class Chess:
         'k': "King"
     }
 
+    # the server's piece names back to our piece types
+    PIECE_TYPES = {name: type for type, name in PIECE_MAP.items()}
+
     PIECE_VALUES = {
         'b': {
             'p': -1,
@@ -40,7 +43,14 @@ class Chess:
         self.kings = {WHITE: EMPTY, BLACK: EMPTY}
         self.castling = {WHITE: 0, BLACK: 0}
         self.history = []
+        # Zobrist keys of the positions before each move in history
+        self.keys = []
         self.value = 0
+        self.key = 0
+        # piece counts per color and type, and bishops per square color
+        self.material = {color: {type: 0 for type in Chess.PIECE_MAP} for color in [WHITE, BLACK]}
+        self.bishops = {WHITE: [0, 0], BLACK: [0, 0]}
+        self._status = None
 
         self.load(fen)
 
@@ -82,6 +92,9 @@ class Chess:
         self.half_moves = int(tokens[4])
         self.move_number = int(tokens[5])
 
+        self.key = self.compute_key()
+        self._status = None
+
     def generate_fen(self):
         empty = 0
         fen = ""
@@ -131,16 +144,55 @@ class Chess:
         return ' '.join(
             [fen, self.turn, cflags, epflags, str(self.half_moves), str(self.move_number)])
     
+    def compute_key(self):
+        key = 0
+
+        for i in BOARD_SQUARES:
+            piece = self.board[i]
+
+            if piece:
+                key ^= ZOBRIST_PIECES[piece.color][piece.type][i]
+
+        key ^= ZOBRIST_CASTLING[WHITE][self.castling[WHITE]]
+        key ^= ZOBRIST_CASTLING[BLACK][self.castling[BLACK]]
+        key ^= self.ep_key()
+
+        if self.turn == WHITE:
+            key ^= ZOBRIST_WHITE_TURN
+
+        return key
+
+    def ep_key(self):
+        # the en passant square only counts if the side to move can capture on it
+        if self.ep_square == EMPTY:
+            return 0
+
+        for offset in PAWN_OFFSETS[self.turn][2:]:
+            square = self.ep_square - offset
+            piece = None if square & 0x88 else self.board[square]
+
+            if piece and piece.type == PAWN and piece.color == self.turn:
+                return ZOBRIST_EP[Chess.get_file(self.ep_square)]
+
+        return 0
+
     def get_piece(square):
         return self.board[SQUARES[square].value]
 
     def place_piece(self, piece, square):
         sq = SQUARES[square].value
         self.board[sq] = piece
+        self.update_material(piece.color, piece.type, sq, 1)
 
         if piece.type == KING:
             self.kings[piece.color] = sq
 
+    def update_material(self, color, type, square, change):
+        self.material[color][type] += change
+
+        if type == BISHOP:
+            self.bishops[color][Chess.get_square_color(square)] += change
+
     def remove_piece(self, square):
         piece = self.get_piece(square)
         self.board[SQUARES[square].value] = None
@@ -263,33 +315,39 @@ class Chess:
                         if piece.type in ['n', 'k']:
                             break
 
-        if not single_square or last_sq == self.kings[us]:
+        if (self.castling[us] and
+                (not single_square or SQUARES[single_square].value == self.kings[us])):
+            castling_from = self.kings[us]
+            # built at most once, and only if some castling path is clear
+            danger = None
+
             # kingside castling
             if self.castling[us] & Bits.KSIDE_CASTLE.value:
-                castling_from = self.kings[us]
                 castling_to = castling_from + 2
 
                 # if the path is clear, we're not in check and won't be in check
-                if (not self.board[castling_from+1] and
-                        not self.board[castling_to] and
-                        not self.attacked(them, self.kings[us]) and
-                        not self.attacked(them, castling_from+1) and
-                        not self.attacked(them, castling_to)):
-                    moves += add_move(self.kings[us], castling_to, Bits.KSIDE_CASTLE.value)
+                if not self.board[castling_from+1] and not self.board[castling_to]:
+                    danger = danger or self.attack_map().attacks[them]
+
+                    if not (danger[castling_from] or
+                            danger[castling_from+1] or
+                            danger[castling_to]):
+                        moves += add_move(castling_from, castling_to, Bits.KSIDE_CASTLE.value)
 
             # queenside castling
             if self.castling[us] & Bits.QSIDE_CASTLE.value:
-                castling_from = self.kings[us]
                 castling_to = castling_from - 2
 
                 # if the path is clear, we're not in check and won't be in check
                 if (not self.board[castling_from-1] and
                         not self.board[castling_from-2] and
-                        not self.board[castling_from-3] and
-                        not self.attacked(them, self.kings[us]) and
-                        not self.attacked(them, castling_from-1) and
-                        not self.attacked(them, castling_to)):
-                    moves += add_move(self.kings[us], castling_to, Bits.QSIDE_CASTLE.value)
+                        not self.board[castling_from-3]):
+                    danger = danger or self.attack_map().attacks[them]
+
+                    if not (danger[castling_from] or
+                            danger[castling_from-1] or
+                            danger[castling_to]):
+                        moves += add_move(castling_from, castling_to, Bits.QSIDE_CASTLE.value)
 
         # if we're allowing illegal moves
         if not legal:
@@ -354,91 +412,170 @@ class Chess:
 
         return False
 
+    def attack_map(self):
+        # one pass over the board, counting every square each side attacks
+        attack_map = AttackMap()
+
+        for i in BOARD_SQUARES:
+            piece = self.board[i]
+            if not piece:
+                continue
+
+            counts = attack_map.attacks[piece.color]
+
+            if piece.type == PAWN:
+                for offset in PAWN_OFFSETS[piece.color][2:]:
+                    square = i + offset
+
+                    if not square & 0x88:
+                        counts[square] += 1
+                continue
+
+            mobility = 0
+            for offset in PIECE_OFFSETS[piece.type]:
+                square = i + offset
+
+                while not square & 0x88:
+                    counts[square] += 1
+                    occupant = self.board[square]
+
+                    if not occupant or occupant.color != piece.color:
+                        mobility += 1
+
+                    # stop at the first blocker, or after one step for knights and kings
+                    if occupant or piece.type in ['n', 'k']:
+                        break
+
+                    square += offset
+
+            attack_map.mobility[piece.color] += mobility
+
+        return attack_map
+
+    def evaluate(self):
+        # material plus attack-map terms, positive in white's favour
+        attack_map = self.attack_map()
+        score = self.value
+        score += MOBILITY_WEIGHT * (attack_map.mobility[WHITE] - attack_map.mobility[BLACK])
+
+        for color, sign in [(WHITE, 1), (BLACK, -1)]:
+            them = Chess.swap_color(color)
+            king = self.kings[them]
+
+            # pressure on the squares around the enemy king
+            if king != EMPTY:
+                zone = attack_map.attacks[color][king]
+
+                for offset in PIECE_OFFSETS[KING]:
+                    if not (king + offset) & 0x88:
+                        zone += attack_map.attacks[color][king + offset]
+
+                score += sign * KING_ZONE_WEIGHT * zone
+
+        # the side to move can simply take undefended pieces left en prise
+        us = self.turn
+        them = Chess.swap_color(us)
+
+        for i in BOARD_SQUARES:
+            piece = self.board[i]
+
+            if (piece and piece.color == them and piece.type != KING and
+                    attack_map.attacks[us][i] and not attack_map.attacks[them][i]):
+                score += HANGING_WEIGHT * Chess.PIECE_VALUES[us][piece.type]
+
+        return score
+
     def king_attacked(self, color):
         return self.attacked(Chess.swap_color(color), self.kings[color])
 
     def in_check(self):
         return self.king_attacked(self.turn)
 
+    def status(self):
+        # legal moves and terminal flags for this position, computed once and
+        # kept until the next move or undo
+        if self._status is None or self._status.key != self.key:
+            self._status = Status(self)
+
+        return self._status
+
     def in_checkmate(self):
-        return self.in_check() and not self.generate_moves()
+        return self.status().checkmate
 
     def in_stalemate(self):
-        return not self.in_check() and not self.generate_moves()
+        return self.status().stalemate
 
     def insufficient_material(self):
-        pieces = {}
-        bishops = []
-        num_pieces = 0
-        sq_color = 0
+        white = self.material[WHITE]
+        black = self.material[BLACK]
 
-        i = SQUARES.a8.value - 1
-        while i <= SQUARES.h1.value:
-            i += 1
-            sq_color = (sq_color + 1) % 2
-
-            if i & 0x88:
-                i += 7
-                continue
-
-            piece = self.board[i]
-
-            if piece:
-                pieces[piece.type] = pieces.get(piece.type, 0) + 1
-
-                if piece.type == BISHOP:
-                    bishops.append(sq_color)
+        # any pawn, rook or queen can still mate
+        if (white[PAWN] or black[PAWN] or white[ROOK] or black[ROOK] or
+                white[QUEEN] or black[QUEEN]):
+            return False
 
-                num_pieces += 1
+        knights = white[KNIGHT] + black[KNIGHT]
+        bishops = white[BISHOP] + black[BISHOP]
 
-        # K vs. K
-        if num_pieces == 2:
+        # K vs. K, K vs. KN or K vs. KB
+        if knights + bishops <= 1:
             return True
-        # K vs. KN or K vs. KB
-        elif num_pieces == 3 and (pieces.get(BISHOP, 0) == 1 or pieces.get(KNIGHT, 0) == 1):
-            return True
-        # KB vs. KB where any number of bishops are all the same color
-        elif num_pieces == (pieces.get(BISHOP, 0)+2):
-            b_sum = sum(bishops)
 
-            if sum == 0 or sum == len(bishops):
-                return True
+        # KB vs. KB where any number of bishops are all on the same square color
+        if not knights:
+            light = self.bishops[WHITE][0] + self.bishops[BLACK][0]
+            dark = self.bishops[WHITE][1] + self.bishops[BLACK][1]
+
+            return not light or not dark
 
         return False
 
     def in_threefold_repetition(self):
-        # if we don't have enough moves to determine repetition
-        if len(self.history) < 8:
-            return False
+        # positions can only repeat since the last capture or pawn move, and
+        # only every other ply, when the same side is to move again
+        last = min(self.half_moves, len(self.keys))
+        seen = 0
 
-        # if there's been a capture, promotion or pawn movement in the past 8 moves
-        for _, move in self.history[-8:]:
-            if move.captured or move.promotion or move.piece == PAWN:
-                return False
+        for i in range(2, last+1, 2):
+            if self.keys[-i] == self.key:
+                seen += 1
 
-        # if each player's past 2 pairs of moves are not equal
-        for i, j in zip(range(-8, -4), range(-4, 0)):
-            if self.history[i][1] != self.history[j][1]:
-                return False
+                if seen == 2:
+                    return True
 
-        return True
+        return False
 
     def in_draw(self):
-        return (self.in_stalemate() or
-                self.insufficient_material() or
-                self.in_threefold_repetition())
+        return self.status().draw
 
     def game_over(self):
-        return self.half_moves() >= 100 or self.in_checkmate() or self.in_draw()
+        return self.status().game_over
 
     def move(self, move):
         us = self.turn
         them = Chess.swap_color(us)
         self.snapshot(move)
+        self.keys.append(self.key)
+        self._status = None
+
+        # take the old castling rights, en passant square and turn out of the key
+        key = self.key ^ self.ep_key() ^ ZOBRIST_WHITE_TURN
+        key ^= ZOBRIST_CASTLING[WHITE][self.castling[WHITE]]
+        key ^= ZOBRIST_CASTLING[BLACK][self.castling[BLACK]]
+
+        key ^= ZOBRIST_PIECES[us][move.piece][move.m_from]
+        key ^= ZOBRIST_PIECES[us][move.promotion or move.piece][move.m_to]
+        if move.flags & Bits.CAPTURE.value:
+            key ^= ZOBRIST_PIECES[them][move.captured][move.m_to]
 
         # if capture, subtract value of piece
         self.value -= Chess.PIECE_VALUES[them].get(move.captured, 0)
 
+        if move.flags & Bits.CAPTURE.value:
+            self.update_material(them, move.captured, move.m_to, -1)
+        elif move.flags & Bits.EP_CAPTURE.value:
+            self.material[them][PAWN] -= 1
+
         self.board[move.m_to] = self.board[move.m_from]
         self.board[move.m_from] = None
 
@@ -446,8 +583,10 @@ class Chess:
         if move.flags & Bits.EP_CAPTURE.value:
             if self.turn == BLACK:
                 self.board[move.m_to-16] = None
+                key ^= ZOBRIST_PIECES[them][PAWN][move.m_to-16]
             else:
                 self.board[move.m_to+16] = None
+                key ^= ZOBRIST_PIECES[them][PAWN][move.m_to+16]
 
         # if pawn promotion, replace with new piece
         if move.promotion:
@@ -455,6 +594,8 @@ class Chess:
             self.value += Chess.PIECE_VALUES[self.turn][move.promotion]
 
             self.board[move.m_to] = Piece(move.promotion, us)
+            self.update_material(us, PAWN, move.m_from, -1)
+            self.update_material(us, move.promotion, move.m_to, 1)
 
         # if we moved the king
         if self.board[move.m_to].type == KING:
@@ -467,12 +608,14 @@ class Chess:
 
                 self.board[castling_to] = self.board[castling_from]
                 self.board[castling_from] = None
+                key ^= ZOBRIST_PIECES[us][ROOK][castling_from] ^ ZOBRIST_PIECES[us][ROOK][castling_to]
             elif move.flags & Bits.QSIDE_CASTLE.value:
                 castling_to = move.m_to + 1
                 castling_from = move.m_to - 2
 
                 self.board[castling_to] = self.board[castling_from]
                 self.board[castling_from] = None
+                key ^= ZOBRIST_PIECES[us][ROOK][castling_from] ^ ZOBRIST_PIECES[us][ROOK][castling_to]
 
             # remove castling permissions
             self.castling[us] = 0
@@ -511,6 +654,11 @@ class Chess:
 
         self.turn = Chess.swap_color(self.turn)
 
+        # put the new castling rights and en passant square back into the key
+        key ^= ZOBRIST_CASTLING[WHITE][self.castling[WHITE]]
+        key ^= ZOBRIST_CASTLING[BLACK][self.castling[BLACK]]
+        self.key = key ^ self.ep_key()
+
     def undo(self):
         try:
             old, move = self.history.pop()
@@ -525,6 +673,8 @@ class Chess:
         self.half_moves = old.half_moves
         self.move_number = old.move_number
         self.value = old.value
+        self.key = self.keys.pop()
+        self._status = old._status
 
         us = self.turn
         them = Chess.swap_color(us)
@@ -533,9 +683,15 @@ class Chess:
         self.board[move.m_from].type = move.piece # undo any promotions
         self.board[move.m_to] = None
 
+        if move.promotion:
+            self.update_material(us, move.promotion, move.m_to, -1)
+            self.update_material(us, PAWN, move.m_from, 1)
+
         if move.flags & Bits.CAPTURE.value:
             self.board[move.m_to] = Piece(move.captured, them)
+            self.update_material(them, move.captured, move.m_to, 1)
         elif move.flags & Bits.EP_CAPTURE.value:
+            self.material[them][PAWN] += 1
             index = 0
 
             if us == BLACK:
@@ -577,20 +733,128 @@ class Chess:
     def get_rank(i):
         return i >> 4
 
+    @staticmethod
+    def get_square_color(i):
+        # 0 for light squares, 1 for dark squares
+        return (Chess.get_rank(i) + Chess.get_file(i)) & 1
+
     @staticmethod
     def swap_color(color):
         return WHITE if color == BLACK else BLACK
 
-    def get_enemy_move(self, fr_from, fr_to):
-        matching_move = None
+    @staticmethod
+    def get_move_key(move):
+        # a hashable stand-in for a move that stays valid across copies and turns
+        return (move.m_from, move.m_to, move.promotion)
+
+    @staticmethod
+    def get_square(file, rank):
+        # file 'a'-'h' and rank 1-8 to a 0x88 index
+        return (8 - int(rank)) * 16 + "abcdefgh".index(file)
+
+    def reaches(self, m_from, m_to):
+        # whether the non-pawn piece on m_from moves to m_to on an empty board
+        # path, the same lookup attacked() does
+        piece = self.board[m_from]
+        index = m_from - m_to + 119
+
+        if not ATTACKS[index] & (1 << SHIFTS[piece.type]):
+            return False
+
+        if piece.type in ['n', 'k']:
+            return True
+
+        offset = RAYS[index]
+        j = m_from + offset
+        while j != m_to:
+            if self.board[j]:
+                return False
+            j += offset
+
+        return True
+
+    def build_move(self, m_from, m_to, promotion=''):
+        # builds a move straight from its squares, without generating the
+        # move list, and returns None if it isn't legal here
+        us = self.turn
+        piece = self.board[m_from]
+        target = self.board[m_to]
+
+        if not piece or piece.color != us or (target and target.color == us):
+            return None
+
+        last_rank = Chess.get_rank(m_to) in [RANK_8, RANK_1]
+        flags = Bits.CAPTURE.value if target else Bits.NORMAL.value
+
+        if piece.type == PAWN:
+            offsets = PAWN_OFFSETS[us]
+            second_rank = RANK_2 if us == WHITE else RANK_7
+
+            if m_to == m_from + offsets[1]:
+                if (target or self.board[m_from + offsets[0]] or
+                        Chess.get_rank(m_from) != second_rank):
+                    return None
+                flags = Bits.BIG_PAWN.value
+            elif m_to in [m_from + offsets[2], m_from + offsets[3]]:
+                if not target:
+                    if m_to != self.ep_square:
+                        return None
+                    flags = Bits.EP_CAPTURE.value
+            elif m_to != m_from + offsets[0] or target:
+                return None
+
+            if last_rank != (promotion in [QUEEN, ROOK, BISHOP, KNIGHT]):
+                return None
+        elif promotion:
+            return None
+        elif piece.type == KING and abs(m_to - m_from) == 2:
+            # castling has its own conditions, so let the generator check them
+            for move in self.generate_moves(single_square=Chess.get_san(m_from)):
+                if move.m_to == m_to:
+                    return move
+
+            return None
+        elif not self.reaches(m_from, m_to):
+            return None
+
+        move = Move(self.board, us, m_from, m_to, flags, promotion)
+
+        # the only thing left to rule out is leaving our king in check
+        self.move(move)
+        legal = not self.king_attacked(us)
+        self.undo()
+
+        return move if legal else None
+
+
+class Status:
+    def __init__(self, chess):
+        self.key = chess.key
+        self.moves = chess.generate_moves()
+        self.check = chess.in_check()
+
+        self.checkmate = self.check and not self.moves
+        self.stalemate = not self.check and not self.moves
+        self.fifty_moves = chess.half_moves >= 100
+        self.repetition = chess.in_threefold_repetition()
+        self.insufficient_material = chess.insufficient_material()
+
+        self.draw = (self.stalemate or
+                     self.fifty_moves or
+                     self.repetition or
+                     self.insufficient_material)
+        self.game_over = self.checkmate or self.draw
+
 
-        for move in self.generate_moves():
-            if (Chess.get_san(move.m_from) == fr_from and
-                    Chess.get_san(move.m_to) == fr_to):
-                matching_move = move
-                break
+class AttackMap:
+    def __init__(self):
+        # per-side attack counts for every 0x88 square
+        self.attacks = {WHITE: [0] * 128, BLACK: [0] * 128}
+        # per-side count of pseudo-legal piece destinations (pawns excluded)
+        self.mobility = {WHITE: 0, BLACK: 0}
 
-        return matching_move
+    def attackers(self, color, square):
+        return self.attacks[color][square]
 
 
 class Piece:
@@ -11,6 +11,7 @@ from games.chess.game_object import GameObject
 from games.chess.move import Move
 from games.chess.piece import Piece
 from games.chess.player import Player
+from games.chess.move_history import MoveWindow
 
 
 class Game(BaseGame):
@@ -35,6 +36,11 @@ class Game(BaseGame):
         self._session = ""
         self._turns_to_draw = 0
 
+        # (file, rank) -> the Piece on that square, and each Piece id's
+        # indexed square, kept in sync as their deltas are merged
+        self._pieces_by_square = {}
+        self._piece_squares = {}
+
         self.name = "Chess"
 
         self._game_object_classes = {
@@ -123,3 +129,63 @@ class Game(BaseGame):
         :rtype: int
         """
         return self._turns_to_draw
+
+    def keep_moves(self, size):
+        """Keeps only the last size Moves in moves, packing older ones into 16 bits each.
+
+        Packed Moves are also dropped from game_objects. The full history
+        stays available through iter_moves().
+
+        Args:
+            size (int): How many of the latest Moves to keep as game objects.
+        """
+        window = MoveWindow(size, self._forget_move)
+        for move in self.moves:
+            window.append(move)
+
+        self._moves = window
+
+    def iter_moves(self, start=0):
+        """Iterates over the moves made so far, whether or not keep_moves() is packing them.
+
+        Args:
+            start (int): The index of the first move to yield.
+
+        Yields:
+            Move or PackedMove: Each move, PackedMoves having the same from/to/promotion fields as Move.
+        """
+        if isinstance(self._moves, MoveWindow):
+            return self._moves.moves(start)
+
+        return iter(self._moves[start:])
+
+    def _forget_move(self, move):
+        # nothing else refers to a move once it's packed
+        self._game_objects.pop(move.id, None)
+
+    def get_piece_at(self, file, rank):
+        """Gets the Piece on a square.
+
+        Args:
+            file (str): The file of the square, [a-h].
+            rank (int): The rank of the square, [1-8].
+
+        Returns:
+            Piece: The Piece on that square, or None if it is empty.
+        """
+        return self._pieces_by_square.get((file, rank))
+
+    def _game_object_merged(self, game_object):
+        if not isinstance(game_object, Piece):
+            return
+
+        # a piece that moved (or was taken) leaves its old square, unless
+        # whatever took it has already been indexed there
+        old = self._piece_squares.pop(game_object.id, None)
+        if old is not None and self._pieces_by_square.get(old) is game_object:
+            del self._pieces_by_square[old]
+
+        if not game_object.captured:
+            square = (game_object.file, game_object.rank)
+            self._pieces_by_square[square] = game_object
+            self._piece_squares[game_object.id] = square
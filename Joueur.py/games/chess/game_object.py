@@ -13,6 +13,8 @@ class GameObject(BaseGameObject):
     An object in the game. The most basic class that all game classes should inherit from automatically.
     """
 
+    __slots__ = ('_game_object_name', '_id', '_logs')
+
     def __init__(self):
         """Initializes a GameObject with basic logic as provided by the Creer code generator."""
         BaseGameObject.__init__(self)
@@ -0,0 +1,177 @@
+import math
+import random
+import time
+from multiprocessing import Pool
+
+# local imports
+from games.chess.constants import *
+from games.chess.engine import Chess
+
+
+def playout(fen, plies):
+    """Plays random moves from fen and scores where it ends up.
+
+    Runs in the worker processes, so it only takes and returns plain values.
+
+    Returns:
+        float: The expected score for white, from 0 (black wins) to 1 (white wins).
+    """
+    chess = Chess(fen)
+
+    for _ in range(plies):
+        status = chess.status()
+
+        if status.checkmate:
+            return 0.0 if chess.turn == WHITE else 1.0
+        if status.draw:
+            return 0.5
+
+        chess.move(random.choice(status.moves))
+
+    # squash the static evaluation into a win probability
+    return 1 / (1 + math.exp(-chess.evaluate() / MCTS_EVALUATION_SCALE))
+
+
+class MonteCarloTreeSearch:
+    """A UCT search whose playouts are spread over a process pool.
+
+    Nodes live in parallel lists indexed by node number. Each node's score is
+    kept from the point of view of the side that played the move into it.
+    """
+
+    def __init__(self, processes, playout_plies, exploration=MCTS_EXPLORATION):
+        self.processes = processes
+        self.playout_plies = playout_plies
+        self.exploration = exploration
+        self.pool = Pool(processes) if processes > 1 else None
+
+    def close(self):
+        if self.pool:
+            self.pool.terminate()
+            self.pool = None
+
+    def reset(self):
+        self.parent = []
+        self.move = []
+        self.children = []
+        self.visits = []
+        self.score = []
+        # set for nodes whose result is known without playouts
+        self.terminal = []
+
+    def add_node(self, parent, move):
+        self.parent.append(parent)
+        self.move.append(move)
+        self.children.append(None)
+        self.visits.append(0)
+        self.score.append(0.0)
+        self.terminal.append(None)
+
+        return len(self.parent) - 1
+
+    def search(self, chess, seconds, interrupted=None):
+        """Searches from the current position for about the given number of seconds.
+
+        Args:
+            chess (Chess): The position to search. It is left as it was found.
+            seconds (float): The time budget.
+            interrupted (threading.Event): Stops the search early once set.
+
+        Returns:
+            Move: The most visited move, or None if there are no legal moves or the search was interrupted.
+        """
+        self.reset()
+        root = self.add_node(-1, None)
+        deadline = time.time() + seconds
+
+        while time.time() < deadline:
+            if interrupted and interrupted.is_set():
+                return None
+
+            # pick one leaf per worker, with virtual visits so they spread out
+            leaves = [self.select(chess, root) for _ in range(self.processes)]
+            pending = [leaf for leaf in leaves if self.terminal[leaf[0]] is None]
+
+            if not pending and self.children[root] == []:
+                break
+
+            results = self.playouts([fen for _, fen in pending])
+
+            for node, fen in leaves:
+                result = self.terminal[node]
+
+                if result is None:
+                    result = results.pop(0)
+
+                self.back_up(node, result)
+
+        if not self.children[root]:
+            return None
+
+        best = max(self.children[root], key=lambda child: self.visits[child])
+        return self.move[best]
+
+    def playouts(self, fens):
+        if self.pool:
+            return self.pool.starmap(playout, [(fen, self.playout_plies) for fen in fens])
+
+        return [playout(fen, self.playout_plies) for fen in fens]
+
+    def select(self, chess, node):
+        # walk down by UCT to a leaf, expanding it on the way in
+        depth = 0
+
+        while True:
+            self.visits[node] += 1
+
+            if self.children[node] is None:
+                self.expand(chess, node)
+
+            children = self.children[node]
+            if not children or self.terminal[node] is not None:
+                break
+
+            unvisited = [child for child in children if not self.visits[child]]
+            if unvisited:
+                node = random.choice(unvisited)
+                chess.move(self.move[node])
+                depth += 1
+                self.visits[node] += 1
+                break
+
+            log_visits = math.log(self.visits[node])
+            node = max(children, key=lambda child: (
+                self.score[child] / self.visits[child] +
+                self.exploration * math.sqrt(log_visits / self.visits[child])))
+
+            chess.move(self.move[node])
+            depth += 1
+
+        if self.children[node] is None:
+            self.expand(chess, node)
+
+        # the playout result is wanted for white, whoever is to move
+        leaf = (node, chess.generate_fen())
+
+        for _ in range(depth):
+            chess.undo()
+
+        return leaf
+
+    def expand(self, chess, node):
+        status = chess.status()
+
+        if status.checkmate:
+            self.terminal[node] = 0.0 if chess.turn == WHITE else 1.0
+        elif status.draw:
+            self.terminal[node] = 0.5
+
+        self.children[node] = [self.add_node(node, move) for move in status.moves]
+
+    def back_up(self, node, result):
+        # visits were already counted on the way down
+        while node > 0:
+            # the move into this node was played by the side not to move there
+            mover = self.move[node].color
+            self.score[node] += result if mover == WHITE else 1 - result
+            node = self.parent[node]
@@ -13,6 +13,9 @@ class Move(GameObject):
     Contains all details about a Piece's move in the game.
     """
 
+    __slots__ = ('_captured', '_from_file', '_from_rank', '_piece',
+                 '_promotion', '_san', '_to_file', '_to_rank')
+
     def __init__(self):
         """Initializes a Move with basic logic as provided by the Creer code generator."""
         GameObject.__init__(self)
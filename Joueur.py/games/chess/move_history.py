@@ -0,0 +1,114 @@
+from array import array
+from collections import namedtuple
+
+# a move that was compacted out of Game.moves, with the fields of Move that
+# say what was played
+PackedMove = namedtuple('PackedMove', ['from_file', 'from_rank', 'to_file', 'to_rank', 'promotion'])
+
+FILES = "abcdefgh"
+PROMOTIONS = ["", "Queen", "Rook", "Bishop", "Knight"]
+
+
+def pack(move):
+    # 6 bits per square and 3 for the promotion, so a move fits in 16 bits
+    m_from = FILES.index(move.from_file) + (move.from_rank - 1) * 8
+    m_to = FILES.index(move.to_file) + (move.to_rank - 1) * 8
+
+    return m_from | m_to << 6 | PROMOTIONS.index(move.promotion) << 12
+
+
+def unpack(packed):
+    m_from = packed & 63
+    m_to = (packed >> 6) & 63
+
+    return PackedMove(FILES[m_from & 7], (m_from >> 3) + 1,
+                      FILES[m_to & 7], (m_to >> 3) + 1,
+                      PROMOTIONS[packed >> 12])
+
+
+class MoveWindow(list):
+    """The last few entries of the server's move list, kept under their indices in the full list.
+
+    The GameManager merges into it like any other list: len() is the length
+    of the whole list and indices count from the first move of the game.
+    Entries that slide out of the window are packed into 16 bits each.
+    """
+
+    def __init__(self, size, on_compact=None):
+        list.__init__(self)
+        self.size = max(1, size)
+        # how many moves have slid out, and those moves packed
+        self.offset = 0
+        self.packed = array('H')
+        # called with each Move once it is packed
+        self.on_compact = on_compact
+
+    def __len__(self):
+        return self.offset + list.__len__(self)
+
+    def __iter__(self):
+        # just the moves still in the window, see moves()
+        return list.__iter__(self)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return [self[i] for i in range(start, stop, step)]
+
+        return list.__getitem__(self, self.physical(index))
+
+    def __setitem__(self, index, move):
+        if index < 0:
+            index += len(self)
+
+        # the whole list arrived at once and this move is already out of the window
+        if index < self.offset:
+            self.compact(index, move)
+        else:
+            list.__setitem__(self, index - self.offset, move)
+
+    def physical(self, index):
+        if index < 0:
+            index += len(self)
+
+        if index < self.offset:
+            raise IndexError("move {} has been compacted, read it through Game.iter_moves()".format(index))
+
+        return index - self.offset
+
+    def append(self, move):
+        list.append(self, move)
+
+        while list.__len__(self) > self.size:
+            self.compact(self.offset, list.pop(self, 0))
+            self.offset += 1
+
+    def pop(self, index=-1):
+        if list.__len__(self):
+            return list.pop(self, self.physical(index))
+
+        # only ever shrinks from the end, back into the packed moves
+        self.offset -= 1
+        self.packed.pop()
+
+    def compact(self, index, move):
+        while len(self.packed) <= index:
+            self.packed.append(0)
+
+        if move is not None:
+            self.packed[index] = pack(move)
+
+            if self.on_compact:
+                self.on_compact(move)
+
+    def moves(self, start=0):
+        """Iterates over every move from start on, packed ones included.
+
+        Yields:
+            Move or PackedMove: PackedMoves for the moves that slid out, then the Moves still in the window.
+        """
+        for index in range(start, len(self)):
+            if index < self.offset:
+                yield unpack(self.packed[index])
+            else:
+                yield list.__getitem__(self, index - self.offset)
@@ -16,6 +16,8 @@ class Piece(GameObject):
     A chess piece.
     """
 
+    __slots__ = ('_captured', '_file', '_has_moved', '_owner', '_rank', '_type')
+
     def __init__(self):
         """Initializes a Piece with basic logic as provided by the Creer code generator."""
         GameObject.__init__(self)
@@ -13,6 +13,10 @@ class Player(GameObject):
     A player in this game. Every AI controls one player.
     """
 
+    __slots__ = ('_client_type', '_color', '_in_check', '_lost', '_made_move',
+                 '_name', '_opponent', '_pieces', '_rank_direction',
+                 '_reason_lost', '_reason_won', '_time_remaining', '_won')
+
     def __init__(self):
         """Initializes a Player with basic logic as provided by the Creer code generator."""
         GameObject.__init__(self)
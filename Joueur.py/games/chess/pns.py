@@ -0,0 +1,134 @@
+import time
+
+INFINITY = 10**9
+
+
+class ProofNumberSearch:
+    """A proof-number search mate solver for the side to move.
+
+    The tree lives in a bounded node table of parallel lists. OR nodes have
+    the attacker to move and AND nodes the defender. Leaves start with
+    mobility-based proof and disproof numbers, so replies with few legal
+    moves are explored first.
+    """
+
+    def __init__(self, max_nodes, max_plies, max_time):
+        self.max_nodes = max_nodes
+        self.max_plies = max_plies
+        self.max_time = max_time
+
+    def reset(self):
+        self.proof = []
+        self.disproof = []
+        self.parent = []
+        self.move = []
+        self.children = []
+        self.depth = []
+
+    def add_node(self, parent, move, proof, disproof):
+        self.proof.append(proof)
+        self.disproof.append(disproof)
+        self.parent.append(parent)
+        self.move.append(move)
+        self.children.append(None)
+        self.depth.append(0 if parent < 0 else self.depth[parent] + 1)
+
+        return len(self.proof) - 1
+
+    def find_mate(self, chess, interrupted=None):
+        """Searches for a forced mate for the side to move.
+
+        Args:
+            chess (Chess): The position to solve. It is left as it was found.
+            interrupted (threading.Event): Stops the search early once set.
+
+        Returns:
+            Move: The first move of a forced mate, or None if none was proven within the limits.
+        """
+        self.reset()
+        root = self.add_node(-1, None, 1, 1)
+        deadline = time.time() + self.max_time
+
+        while (self.proof[root] and self.disproof[root] and
+               len(self.proof) < self.max_nodes and time.time() < deadline):
+            if interrupted and interrupted.is_set():
+                return None
+
+            node = self.select(chess, root)
+            self.expand(chess, node)
+            self.back_up(chess, node)
+
+        if self.proof[root]:
+            return None
+
+        for child in self.children[root]:
+            if not self.proof[child]:
+                return self.move[child]
+
+    def select(self, chess, node):
+        # walk down to the most-proving node, playing its moves on the board
+        while self.children[node] is not None:
+            children = self.children[node]
+
+            if self.depth[node] % 2 == 0:
+                node = min(children, key=lambda child: self.proof[child])
+            else:
+                node = min(children, key=lambda child: self.disproof[child])
+
+            chess.move(self.move[node])
+
+        return node
+
+    def expand(self, chess, node):
+        children = []
+        # the children of an OR node are AND nodes, and vice versa
+        defender_to_move = self.depth[node] % 2 == 0
+
+        for move in chess.status().moves:
+            chess.move(move)
+            status = chess.status()
+
+            if defender_to_move:
+                if status.checkmate:
+                    proof, disproof = 0, INFINITY
+                elif status.draw or self.depth[node] + 1 >= self.max_plies:
+                    proof, disproof = INFINITY, 0
+                else:
+                    proof, disproof = len(status.moves), 1
+            else:
+                if status.game_over:
+                    proof, disproof = INFINITY, 0
+                else:
+                    proof, disproof = 1, len(status.moves)
+
+            chess.undo()
+            children.append(self.add_node(node, move, proof, disproof))
+
+        self.children[node] = children
+
+    def back_up(self, chess, node):
+        # recompute the numbers of every ancestor, undoing the moves on the way up
+        while True:
+            children = self.children[node]
+
+            if children:
+                proofs = [self.proof[child] for child in children]
+                disproofs = [self.disproof[child] for child in children]
+
+                if self.depth[node] % 2 == 0:
+                    self.proof[node] = min(proofs)
+                    self.disproof[node] = min(sum(disproofs), INFINITY)
+                else:
+                    self.proof[node] = min(sum(proofs), INFINITY)
+                    self.disproof[node] = min(disproofs)
+            elif self.depth[node] % 2 == 0 or not chess.in_check():
+                # the attacker has no moves, or the defender is stalemated
+                self.proof[node], self.disproof[node] = INFINITY, 0
+            else:
+                self.proof[node], self.disproof[node] = 0, INFINITY
+
+            if self.parent[node] < 0:
+                break
+
+            chess.undo()
+            node = self.parent[node]
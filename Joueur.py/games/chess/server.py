@@ -0,0 +1,517 @@
+# A stand-in for the game server, to play clients against each other locally.
+#
+# It speaks the same EOT delimited JSON protocol over TCP as the real server,
+# with the Chess engine as referee, and reports how long each game's turns
+# took and how much was sent. Only one game runs at a time, and there are no
+# clocks. Start it, then two clients, from the Joueur.py directory with:
+#     python3 -m games.chess.server -p 3000
+#     python3 main.py Chess -s localhost:3000 &
+#     python3 main.py Chess -s localhost:3000
+
+import argparse
+import copy
+import socket
+import statistics
+import time
+
+# local imports
+import joueur.codec as codec
+from games.chess.constants import *
+from games.chess.engine import Chess
+
+EOT_BYTE = chr(4).encode('utf-8')
+
+# the constants sent in the lobbied event, the client's GameManager reads deltas with them
+DELTA_REMOVED = '&RM'
+DELTA_LIST_LENGTH = '&LEN'
+
+
+def get_delta(old, new):
+    """Gets the delta that turns one state into another, as the real server sends it.
+
+    Lists become dicts with their length under DELTA_LIST_LENGTH, game object
+    references ({'id': ...}) are sent whole, and removed keys are DELTA_REMOVED.
+    """
+    if isinstance(new, list):
+        old = old if isinstance(old, list) else []
+        delta = {DELTA_LIST_LENGTH: len(new)}
+
+        for index, value in enumerate(new):
+            if index >= len(old) or old[index] != value:
+                delta[str(index)] = get_delta(old[index] if index < len(old) else None, value)
+
+        return delta
+
+    if isinstance(new, dict) and not _is_reference(new):
+        old = old if isinstance(old, dict) and not _is_reference(old) else {}
+        delta = {}
+
+        for key, value in new.items():
+            if key not in old or old[key] != value:
+                delta[key] = get_delta(old.get(key), value)
+
+        for key in old:
+            if key not in new:
+                delta[key] = DELTA_REMOVED
+
+        return delta
+
+    return new
+
+
+def _is_reference(value):
+    return len(value) == 1 and 'id' in value
+
+
+class Connection:
+    """One client's socket, framing events in and out and counting what went through it."""
+
+    def __init__(self, client_socket):
+        self.socket = client_socket
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.play_data = None
+        # set once the client is gone, so the game can end without it
+        self.closed = False
+
+        self._buffer = bytearray()
+        self._events = []
+
+        self.frames_sent = self.bytes_sent = 0
+        self.frames_received = self.bytes_received = 0
+
+    def send(self, event, data=None):
+        message = {'event': event, 'sentTime': int(time.time() * 1000)}
+        if data is not None:
+            message['data'] = data
+
+        frame = codec.dumps(message) + EOT_BYTE
+        try:
+            self.socket.sendall(frame)
+        except ConnectionError:
+            self.closed = True
+            raise
+
+        self.frames_sent += 1
+        self.bytes_sent += len(frame)
+
+    def receive(self):
+        """Waits for the next event from the client.
+
+        Returns:
+            dict: The event, with 'event' and 'data' keys.
+        """
+        while not self._events:
+            try:
+                chunk = self.socket.recv(65536)
+            except ConnectionError:
+                self.closed = True
+                raise
+
+            if not chunk:
+                self.closed = True
+                raise ConnectionError('The client disconnected')
+
+            self.bytes_received += len(chunk)
+            self._buffer += chunk
+
+            end = self._buffer.find(EOT_BYTE)
+            while end != -1:
+                self._events.append(codec.loads(self._buffer[:end]))
+                del self._buffer[:end + 1]
+                end = self._buffer.find(EOT_BYTE)
+
+        self.frames_received += 1
+        return self._events.pop(0)
+
+    def close(self):
+        self.socket.close()
+
+
+class Match:
+    """A game of chess between two connections, kept as the state dict the server deltas from."""
+
+    def __init__(self, connections, max_turns=400, fen=DEFAULT_FEN):
+        self.connections = connections
+        self.chess = Chess(fen)
+        self.max_turns = max_turns
+        self.turn_times = []
+
+        self._next_id = 0
+        # piece ids by the 0x88 square they stand on
+        self._square_ids = {}
+        # the state as of the last delta
+        self._sent = {}
+
+        game_objects = {}
+        self.player_ids = []
+        for color, connection in zip(['White', 'Black'], connections):
+            id = self._new_id()
+            game_objects[id] = {
+                'id': id, 'gameObjectName': 'Player', 'logs': [],
+                'name': connection.play_data.get('playerName') or color,
+                'clientType': connection.play_data.get('clientType') or '',
+                'color': color, 'rankDirection': 1 if color == 'White' else -1,
+                'pieces': [], 'inCheck': False, 'madeMove': False,
+                'won': False, 'lost': False, 'reasonWon': '', 'reasonLost': '',
+                # there are no clocks here, so everyone always has the
+                # real server's 15 minutes, in nanoseconds
+                'timeRemaining': 9e11
+            }
+            self.player_ids.append(id)
+
+        white, black = self.player_ids
+        game_objects[white]['opponent'] = {'id': black}
+        game_objects[black]['opponent'] = {'id': white}
+
+        pieces = []
+        for square in BOARD_SQUARES:
+            piece = self.chess.board[square]
+            if not piece:
+                continue
+
+            id = self._new_id()
+            owner = white if piece.color == WHITE else black
+            san = Chess.get_san(square)
+            game_objects[id] = {
+                'id': id, 'gameObjectName': 'Piece', 'logs': [],
+                'type': Chess.PIECE_MAP[piece.type], 'owner': {'id': owner},
+                'file': san[0], 'rank': int(san[1]),
+                'captured': False, 'hasMoved': False
+            }
+            game_objects[owner]['pieces'].append({'id': id})
+            pieces.append({'id': id})
+            self._square_ids[square] = id
+
+        self.state = {
+            'gameObjects': game_objects,
+            'players': [{'id': id} for id in self.player_ids],
+            'pieces': pieces,
+            'moves': [],
+            'currentPlayer': {'id': white if self.chess.turn == WHITE else black},
+            'currentTurn': 0,
+            'maxTurns': max_turns,
+            'turnsToDraw': 100 - self.chess.half_moves,
+            'fen': self.chess.generate_fen(),
+            'session': '0'
+        }
+
+    def _new_id(self):
+        self._next_id += 1
+        return str(self._next_id - 1)
+
+    def send_delta(self):
+        delta = get_delta(self._sent, self.state)
+
+        for connection in self.connections:
+            if not connection.closed:
+                connection.send('delta', delta)
+
+        # only once everyone has it, deltas are safe to send twice but not to miss
+        self._sent = copy.deepcopy(self.state)
+
+    def move(self, piece_id, file, rank, promotion_type):
+        """Plays a Piece's move, as Piece.move() asks the server to.
+
+        Returns:
+            str: The id of the new Move, or None if the move was invalid.
+        """
+        game_objects = self.state['gameObjects']
+        piece = game_objects.get(piece_id)
+        if not piece or piece['gameObjectName'] != 'Piece' or piece['captured']:
+            return None
+
+        try:
+            m_from = Chess.get_square(piece['file'], piece['rank'])
+            m_to = Chess.get_square(file, int(rank))
+        except (KeyError, ValueError, TypeError):
+            return None
+
+        move = self.chess.build_move(m_from, m_to, Chess.PIECE_TYPES.get(promotion_type, ''))
+        if not move:
+            return None
+
+        captured_square = m_to
+        if move.flags & Bits.EP_CAPTURE.value:
+            captured_square = m_to + (16 if move.color == WHITE else -16)
+
+        captured_id = self._square_ids.pop(captured_square, None)
+        if captured_id:
+            captured = game_objects[captured_id]
+            captured['captured'] = True
+
+            reference = {'id': captured_id}
+            self.state['pieces'].remove(reference)
+            game_objects[captured['owner']['id']]['pieces'].remove(reference)
+
+        self.chess.move(move)
+
+        self._move_piece(m_from, m_to)
+        if move.promotion:
+            piece['type'] = Chess.PIECE_MAP[move.promotion]
+
+        # the rook comes along when castling
+        if move.flags & Bits.KSIDE_CASTLE.value:
+            self._move_piece(m_to + 1, m_to - 1)
+        elif move.flags & Bits.QSIDE_CASTLE.value:
+            self._move_piece(m_to - 2, m_to + 1)
+
+        id = self._new_id()
+        from_san = Chess.get_san(m_from)
+        game_objects[id] = {
+            'id': id, 'gameObjectName': 'Move', 'logs': [],
+            'piece': {'id': piece_id},
+            'captured': {'id': captured_id} if captured_id else None,
+            'fromFile': from_san[0], 'fromRank': int(from_san[1]),
+            'toFile': file, 'toRank': int(rank),
+            'promotion': Chess.PIECE_MAP[move.promotion] if move.promotion else '',
+            'san': ''
+        }
+        self.state['moves'].append({'id': id})
+        self.state['fen'] = self.chess.generate_fen()
+        self.state['turnsToDraw'] = 100 - self.chess.half_moves
+
+        return id
+
+    def _move_piece(self, m_from, m_to):
+        id = self._square_ids.pop(m_from)
+        self._square_ids[m_to] = id
+
+        san = Chess.get_san(m_to)
+        self.state['gameObjects'][id].update(file=san[0], rank=int(san[1]), hasMoved=True)
+
+    def run_turn(self, connection, player, order_index):
+        """Orders a player to run its turn and answers its server calls until it has finished.
+
+        Returns:
+            bool: If the player made a move.
+        """
+        game_objects = self.state['gameObjects']
+        moved = False
+
+        started = time.perf_counter()
+        connection.send('order', {'name': 'runTurn', 'index': order_index, 'args': []})
+
+        while True:
+            event = connection.receive()
+
+            if event['event'] == 'finished':
+                break
+
+            if event['event'] != 'run':
+                continue
+
+            data = event['data']
+            caller = game_objects.get((data.get('caller') or {}).get('id'))
+            args = data.get('args') or {}
+            returned = None
+
+            if caller and data['functionName'] == 'log':
+                caller['logs'].append(str(args.get('message')))
+                self.send_delta()
+            elif data['functionName'] == 'move' and not moved and caller and caller.get('owner') == {'id': player['id']}:
+                id = self.move(caller['id'], args.get('file'), args.get('rank'), args.get('promotionType') or '')
+                if id:
+                    moved = True
+                    player['madeMove'] = True
+                    self.send_delta()
+                    returned = {'id': id}
+
+            if returned is None and data['functionName'] == 'move':
+                connection.send('invalid', {'message': 'Invalid move {}.'.format(args)})
+
+            connection.send('ran', returned)
+
+        self.turn_times.append(time.perf_counter() - started)
+        return moved
+
+    def run(self):
+        """Plays the game out, telling the clients still connected once it is over.
+
+        Returns:
+            tuple: (index of the winner or None for a draw, reason).
+        """
+        try:
+            result = self._play()
+        except ConnectionError:
+            connected = [index for index, connection in enumerate(self.connections) if not connection.closed]
+            if len(connected) != 1:
+                raise
+
+            # like the real server, whoever is left wins
+            result = (connected[0], 'Opponent disconnected')
+
+        self._end(*result)
+        return result
+
+    def _play(self):
+        for connection in self.connections:
+            connection.send('lobbied', {
+                'gameName': 'Chess', 'gameSession': self.state['session'],
+                'constants': {'DELTA_REMOVED': DELTA_REMOVED, 'DELTA_LIST_LENGTH': DELTA_LIST_LENGTH}
+            })
+
+        # clients read the game they are starting in before they are told their player
+        self.send_delta()
+        for connection, id in zip(self.connections, self.player_ids):
+            connection.send('start', {'playerID': id})
+
+        game_objects = self.state['gameObjects']
+        result = (None, 'Max turns reached - Draw')
+
+        for turn in range(self.max_turns):
+            side = 0 if self.chess.turn == WHITE else 1
+            player = game_objects[self.player_ids[side]]
+            opponent = game_objects[self.player_ids[1 - side]]
+
+            if not self.run_turn(self.connections[side], player, turn):
+                result = (1 - side, 'Did not make a move')
+                break
+
+            status = self.chess.status()
+            player['madeMove'] = False
+            player['inCheck'] = False
+            opponent['inCheck'] = status.check
+
+            if status.checkmate:
+                result = (side, 'Checkmate')
+                break
+            if status.draw:
+                result = (None, _get_draw_reason(status))
+                break
+
+            self.state['currentTurn'] = turn + 1
+            self.state['currentPlayer'] = {'id': opponent['id']}
+
+            # like the real server, clients hear whose turn it is before the next order
+            self.send_delta()
+
+        return result
+
+    def _end(self, winner, reason):
+        game_objects = self.state['gameObjects']
+        for index, id in enumerate(self.player_ids):
+            player = game_objects[id]
+            player['won'] = winner == index
+            player['lost'] = winner != index
+            player['reasonWon' if winner == index else 'reasonLost'] = reason
+
+        self.send_delta()
+        for connection in self.connections:
+            if not connection.closed:
+                connection.send('over', {})
+
+
+def _get_draw_reason(status):
+    if status.stalemate:
+        return 'Stalemate - Draw'
+    if status.repetition:
+        return 'Threefold repetition - Draw'
+    if status.fifty_moves:
+        return '50 move rule - Draw'
+
+    return 'Insufficient material - Draw'
+
+
+def accept_players(server_socket):
+    """Accepts clients until two have asked to play chess.
+
+    Returns:
+        list: The two Connections, in the order they will play (White first).
+    """
+    connections = []
+
+    while len(connections) < 2:
+        client_socket, address = server_socket.accept()
+        connection = Connection(client_socket)
+
+        try:
+            event = connection.receive()
+            if event['event'] == 'alias':
+                connection.send('named', 'Chess')
+                event = connection.receive()
+
+            if event['event'] != 'play':
+                raise ConnectionError('Expected a play event, got "{}"'.format(event['event']))
+        except (ConnectionError, ValueError, KeyError) as e:
+            print('Dropped a client: {}'.format(e))
+            connection.close()
+            continue
+
+        connection.play_data = event.get('data') or {}
+        connections.append(connection)
+
+    # clients asking for a player index get it, the rest keep the order they joined in
+    indices = [_requested_index(connection, joined) for joined, connection in enumerate(connections)]
+    return [connection for _, connection in sorted(zip(indices, connections), key=lambda pair: pair[0])]
+
+
+def _requested_index(connection, joined):
+    try:
+        return int(connection.play_data.get('playerIndex'))
+    except (TypeError, ValueError):
+        return joined
+
+
+def serve(port=3000, games=1, max_turns=400, fen=DEFAULT_FEN, hostname='localhost'):
+    """Plays games between pairs of clients as they connect, printing each one's stats.
+
+    Can also be run on a thread, to drive clients from the same process.
+    """
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((hostname, port))
+    server_socket.listen(2)
+
+    try:
+        for _ in range(games):
+            connections = accept_players(server_socket)
+            match = Match(connections, max_turns, fen)
+
+            started = time.perf_counter()
+            try:
+                winner, reason = match.run()
+            except ConnectionError as e:
+                # neither client is left to win
+                winner, reason = None, 'Both clients disconnected: {}'.format(e)
+            elapsed = time.perf_counter() - started
+
+            print_stats(match, winner, reason, elapsed)
+
+            for connection in connections:
+                connection.close()
+    finally:
+        server_socket.close()
+
+
+def print_stats(match, winner, reason, elapsed):
+    times = match.turn_times or [0]
+    frames = sum(c.frames_sent + c.frames_received for c in match.connections)
+    sent = sum(c.bytes_sent for c in match.connections)
+    received = sum(c.bytes_received for c in match.connections)
+
+    if winner is not None:
+        result = ['White won', 'Black won'][winner]
+    else:
+        result = 'Draw' if reason.endswith('Draw') else 'No result'
+
+    print("{} after {} turns: {}".format(result, len(match.turn_times), reason))
+    print("  turn time: mean {:.4f}s, median {:.4f}s, max {:.4f}s".format(
+        statistics.mean(times), statistics.median(times), max(times)))
+    print("  {} frames, {} bytes sent, {} bytes received, in {:.3f}s ({:.0f} frames/s)".format(
+        frames, sent, received, elapsed, frames / elapsed if elapsed else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a stand-in chess game server for local clients.')
+    parser.add_argument('-p, --port', action='store', dest='port', type=int, default=3000, help='the port to listen on')
+    parser.add_argument('-g, --games', action='store', dest='games', type=int, default=1, help='how many games to play before exiting')
+    parser.add_argument('--maxTurns', action='store', dest='max_turns', type=int, default=400, help='the number of turns before the game is a draw')
+    parser.add_argument('--fen', action='store', dest='fen', default=DEFAULT_FEN, help='the position to start from')
+    args = parser.parse_args()
+
+    print("Listening on localhost:{}".format(args.port))
+    serve(args.port, args.games, args.max_turns, args.fen)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import asyncio
+import collections
+import contextlib
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from joueur.serializer import deserialize
+import joueur.client as client
+import joueur.session as session
+import joueur.error_code as error_code
+import joueur.ansi_color_coder as color
+
+
+# AsyncClient: the same singleton client as joueur.client, but driven by an
+# asyncio event loop instead of a polling socket. Data is framed as soon as it
+# arrives, and orders run on an executor so the loop keeps servicing the
+# socket while the AI searches.
+class _AsyncClient:
+    loop = None
+    transport = None
+
+_client = _AsyncClient()
+
+
+class _ClientProtocol(asyncio.Protocol):
+    def connection_made(self, transport):
+        _client.transport = transport
+
+    def data_received(self, data):
+        if _client._print_io:
+            print(color.text('magenta') + 'FROM SERVER <-- ' + data.decode(
+                'utf-8', 'replace') + color.reset())
+
+        _client._received_buffer += data
+        events, _client._scanned = client._split_events(
+            _client._received_buffer, _client._scanned)
+
+        if events:
+            _client._events.extend(events)
+            _client._event_added.set()
+
+    def connection_lost(self, exc):
+        _client.transport = None
+
+        if not _client._closing:
+            error_code.handle_error(
+                error_code.DISCONNECTED_UNEXPECTEDLY, exc,
+                'Lost the connection to the server while waiting for events')
+
+
+## swaps joueur.client's functions for these ones, so game objects and error
+## handling reach the server through the event loop too
+def install():
+    for name in ['connect', 'setup', 'send', 'batch', 'disconnect',
+                 'run_on_server', 'play', 'wait_for_event']:
+        setattr(client, name, globals()[name])
+
+
+# buffer_size is only taken for joueur.client's signature, asyncio sizes its own reads
+def connect(hostname='localhost', port=3000, print_io=False, buffer_size=65536):
+    # the handlers in joueur.client print these
+    client._client.hostname = _client.hostname = hostname
+    _client.port = int(port)
+
+    _client._print_io = print_io
+    _client._received_buffer = bytearray()
+    _client._scanned = 0
+    _client._events = collections.deque()
+    _client._closing = False
+    _client._outgoing = []
+    _client._batching = 0
+    client._client._ordering = False
+    client._client._order_done = threading.Event()
+    client._client._cancelled = False
+    _client._order_task = None
+
+    # the thread that called connect drives the loop from here on
+    _client.loop = asyncio.new_event_loop()
+    _client.loop_thread = threading.get_ident()
+    asyncio.set_event_loop(_client.loop)
+    _client._event_added = asyncio.Event()
+    # joueur.client.run_on_server_future queues its futures here, and its
+    # 'ran' handler resolves them
+    client._client._runs = collections.deque()
+    client._client._run_lock = threading.Lock()
+    # one worker, the server never has more than one order out at a time
+    _client.executor = ThreadPoolExecutor(max_workers=1)
+
+    print(color.text('cyan') + 'Connecting to:', _client.hostname + ':' + str(
+        _client.port) + color.reset())
+
+    try:
+        _client.loop.run_until_complete(_client.loop.create_connection(
+            _ClientProtocol, _client.hostname, _client.port))
+    except OSError as e:
+        error_code.handle_error(
+            error_code.COULD_NOT_CONNECT,
+            e,
+            'Could not connect to {}:{}'.format(
+                _client.hostname,
+                _client.port
+            )
+        )
+
+
+def setup(game, ai, manager):
+    client._client.game = _client.game = game
+    client._client.ai = _client.ai = ai
+    client._client.manager = _client.manager = manager
+
+
+# sends the server an event, from the loop's thread or any other one
+def send(event, data):
+    string = client._encode(event, data)
+
+    if _client._print_io:
+        print(color.text('magenta') + 'TO SERVER --> ' + str(
+            string) + color.reset())
+
+    if _client._batching:
+        _client._outgoing.append(string)
+    else:
+        _send_raw(string)
+
+
+def _send_raw(string):
+    if _on_other_thread():
+        _client.loop.call_soon_threadsafe(_write, string)
+    else:
+        _write(string)
+
+
+# events sent inside this block are written together when it closes, the
+# transport already sets TCP_NODELAY and writes everything in full
+@contextlib.contextmanager
+def batch():
+    _client._batching += 1
+    try:
+        yield
+    finally:
+        _client._batching -= 1
+
+        if not _client._batching:
+            _flush()
+
+
+def _flush():
+    if _client._outgoing:
+        string = b''.join(_client._outgoing)
+        _client._outgoing = []
+        _send_raw(string)
+
+
+def _write(string):
+    if _client.transport:
+        _client.transport.write(string)
+
+
+def disconnect(exit_code=None):
+    _client._closing = True
+    session.stop()
+
+    if _client.transport:
+        _client.transport.close()
+
+
+def run_on_server(caller, function_name, args=None):
+    future = client.run_on_server_future(caller, function_name, args)
+    # even inside a batch, we are about to wait on the reply
+    _flush()
+
+    if _on_other_thread():
+        # the loop in play() is still reading events, it resolves the future
+        return future.result()
+
+    return _run(_wait_for_future(future))
+
+
+def play():
+    wait_for_event(None)
+
+
+def wait_for_event(event):
+    return _run(_wait_for_event(event))
+
+
+# runs a coroutine on the loop and blocks until it's done
+def _run(coroutine):
+    if _on_other_thread():
+        # e.g. the AI calling the server from the executor mid-order
+        return asyncio.run_coroutine_threadsafe(coroutine, _client.loop).result()
+
+    try:
+        return _client.loop.run_until_complete(coroutine)
+    except (KeyboardInterrupt, SystemExit):
+        disconnect()
+        sys.exit(0)
+
+
+def _on_other_thread():
+    # true when something other than this thread is driving the loop
+    return (_client.loop.is_running() and
+            _client.loop_thread != threading.get_ident())
+
+
+async def _wait_for_event(event):
+    while True:
+        sent = await _next_event()
+        data = sent['data'] if 'data' in sent else None
+        if event is not None and sent['event'] == event:
+            return data
+
+        _auto_handle(sent['event'], data)
+
+
+async def _wait_for_future(future):
+    while not future.done():
+        sent = await _next_event()
+        _auto_handle(sent['event'], sent['data'] if 'data' in sent else None)
+
+    return future.result()
+
+
+async def _next_event():
+    while not _client._events:
+        _client._event_added.clear()
+        await _client._event_added.wait()
+
+    return _client._events.popleft()
+
+
+def _auto_handle(event, data):
+    if event == 'order':
+        # keep handling events while the AI thinks, e.g. to cancel it on over
+        _client._order_task = _client.loop.create_task(_auto_handle_order(data))
+    else:
+        client._auto_handle(event, data)
+
+
+async def _auto_handle_order(data):
+    args = deserialize(data['args'], _client.game)
+    # so over and fatal events can cancel it
+    client._client._ordering = True
+    client._client._order_done.clear()
+    try:
+        returned = await _client.loop.run_in_executor(
+            _client.executor, client._do_order, data['name'], args)
+    except:
+        error_code.handle_error(error_code.AI_ERRORED, sys.exc_info(),
+                                'AI errored executing order "{}"'.format(
+                                    data['name']))
+
+    if client._client._cancelled:
+        return
+
+    send("finished", {
+        'orderIndex': data['index'],
+        'returned': returned
+    })
@@ -7,6 +7,11 @@ import sys
 
 # @class BaseAI: the basic AI functions that are the same between games
 class BaseAI:
+    # fields merged as soon as their deltas arrive, by game class name,
+    # e.g. {'Game': ['fen']}. Every other field is merged when first read.
+    # None merges everything eagerly.
+    delta_subscriptions = None
+
     def __init__(self, game):
         self._game = game
         self._player = None
@@ -79,6 +84,12 @@ class BaseAI:
                 message="AI has no function '' to respond with.".format(order)
             )
 
+    # intended to be overridden by the AI class. Called from the client's
+    # thread when the game ends or fails while an order is still running, so
+    # a long search can stop early.
+    def cancel(self):
+        pass
+
     # This is called when this AI sends some invalid command to the server.
     # The message explaining why it is invalid will be automatically printed to
     # the screen via this function.
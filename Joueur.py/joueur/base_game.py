@@ -14,3 +14,8 @@ class BaseGame(DeltaMergeable):
         """
         if id in self.game_objects:
             return self.game_objects[id]
+
+    # intended to be overridden by games that index their game objects, called
+    # by the GameManager once a delta has been merged into game_object
+    def _game_object_merged(self, game_object):
+        pass
@@ -2,14 +2,23 @@ import socket
 import errno
 import sys
 import os
-import json
 import time
+import threading
+import collections
+from concurrent.futures import Future
+import contextlib
 from joueur.serializer import serialize, deserialize
+import joueur.codec as codec
+import joueur.session as session
 import joueur.error_code as error_code
 from joueur.game_manager import GameManager
 import joueur.ansi_color_coder as color
 
 EOT_CHAR = chr(4)
+EOT_BYTE = EOT_CHAR.encode('utf-8')
+
+# how long to let a cancelled order stop before the game is ended around it
+CANCEL_TIMEOUT = 5.0
 
 
 # Client: A singleton module that talks to the server receiving game
@@ -20,16 +29,42 @@ class _Client:
 _client = _Client()
 
 
-def connect(hostname='localhost', port=3000, print_io=False):
+def connect(hostname='localhost', port=3000, print_io=False, buffer_size=65536,
+            replay=None):
     _client.hostname = hostname
     _client.port = int(port)
 
     _client._print_io = print_io
-    _client._received_buffer = ""
-    _client._events_stack = []
-    _client._buffer_size = 1024
+    # bytes received but not yet part of a complete frame, and how far into
+    # them we have already looked for an EOT
+    _client._received_buffer = bytearray()
+    _client._scanned = 0
+    _client._events = collections.deque()
+    _client._buffer_size = int(buffer_size)
+    _client._receive_view = memoryview(bytearray(_client._buffer_size))
     _client._timeout_time = 1.0
 
+    # orders run on their own thread so this one keeps reading the socket
+    _client._order_thread = None
+    _client._ordering = False
+    _client._order_done = threading.Event()
+    _client._cancelled = False
+    # futures for the server calls still waiting on a 'ran', oldest first
+    _client._runs = collections.deque()
+    _client._run_lock = threading.Lock()
+    _client._send_lock = threading.Lock()
+    # encoded events waiting to be written, and how many batch() blocks are open
+    _client._outgoing = collections.deque()
+    _client._batching = 0
+    _client._io_thread = threading.current_thread()
+
+    if replay:
+        # no server, the recorded one answers in its place
+        print(color.text('cyan') + 'Replaying:', replay + color.reset())
+        _client.socket = session.Replay(replay)
+        _client.socket.settimeout(_client._timeout_time)
+        return
+
     print(color.text('cyan') + 'Connecting to:', _client.hostname + ':' + str(
         _client.port) + color.reset())
 
@@ -43,6 +78,10 @@ def connect(hostname='localhost', port=3000, print_io=False):
         # interrupts (e.g. keyboard) can be handled
         _client.socket.settimeout(_client._timeout_time)
         _client.socket.connect((_client.hostname, _client.port))
+
+        # our packets are small and we wait on their replies, so don't let
+        # Nagle hold them back for an ACK
+        _client.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     except socket.error as e:
         error_code.handle_error(
             error_code.COULD_NOT_CONNECT,
@@ -64,46 +103,122 @@ def _send_raw(string):
     if _client._print_io:
         print(color.text('magenta') + 'TO SERVER --> ' + str(
             string) + color.reset())
-    _client.socket.send(string)
+    _client._outgoing.append(string)
+
+    if not _client._batching:
+        _flush()
+
+
+# writes everything queued in one go, including what other threads queued
+# while we waited for the lock
+def _flush():
+    with _client._send_lock:
+        parts = []
+        while _client._outgoing:
+            parts.append(_client._outgoing.popleft())
+
+        if not parts:
+            return
+
+        try:
+            _client.socket.sendall(b''.join(parts))
+        except socket.error as e:
+            error_code.handle_error(
+                error_code.DISCONNECTED_UNEXPECTEDLY, e,
+                'Error writing to the socket')
+
+
+# events sent inside this block are written together when it closes
+@contextlib.contextmanager
+def batch():
+    _client._batching += 1
+    try:
+        yield
+    finally:
+        _client._batching -= 1
+
+        if not _client._batching:
+            _flush()
 
 
 # sends the server an event via socket
 def send(event, data):
-    _send_raw(
-        (json.dumps({
-            'sentTime': int(time.time()),
-            'event': event,
-            'data': serialize(data)
-        }) + EOT_CHAR).encode('utf-8')
-    )
+    _send_raw(_encode(event, data))
+
+
+# the bytes of one event, EOT included
+def _encode(event, data):
+    frame = codec.dumps({
+        'sentTime': int(time.time()),
+        'event': event,
+        'data': serialize(data)
+    })
+
+    if session.recording:
+        session.recording.write(session.OUTBOUND, frame)
+
+    return frame + EOT_BYTE
 
 
 def disconnect(exit_code=None):
+    session.stop()
+
     if _client.socket:
         _client.socket.close()
 
 
 def run_on_server(caller, function_name, args=None):
-    send('run', {
-        'caller': caller,
-        'functionName': function_name,
-        'args': args
-    })
+    future = run_on_server_future(caller, function_name, args)
+    # even inside a batch, we are about to wait on the reply
+    _flush()
+
+    if threading.current_thread() is _client._io_thread:
+        return _wait_for_future(future)
 
-    ran_data = wait_for_event('ran')
-    return deserialize(ran_data, _client.game)
+    # an order's thread, the I/O thread reads the reply for us
+    return future.result()
+
+
+# sends a run event without waiting for its reply, so several calls can be
+# in flight at once. The server answers them in order, and each returned
+# Future is resolved with its call's result as the 'ran' events come in
+def run_on_server_future(caller, function_name, args=None):
+    future = Future()
+
+    # queued and sent together, so replies line up with calls across threads
+    with _client._run_lock:
+        _client._runs.append(future)
+        send('run', {
+            'caller': caller,
+            'functionName': function_name,
+            'args': args
+        })
+
+    return future
 
 
 def play():
     wait_for_event(None)
 
 
+# handles events until future is resolved, for server calls made on this thread
+def _wait_for_future(future):
+    while not future.done():
+        wait_for_events()
+
+        while _client._events and not future.done():
+            sent = _client._events.popleft()
+            _auto_handle(sent['event'], sent['data'] if 'data' in sent else None)
+
+    return future.result()
+
+
 def wait_for_event(event):
     while True:
         wait_for_events()
 
-        while len(_client._events_stack) > 0:
-            sent = _client._events_stack.pop()
+        while _client._events:
+            sent = _client._events.popleft()
             data = sent['data'] if 'data' in sent else None
             if event is not None and sent['event'] == event:
                 return data
@@ -114,51 +229,74 @@ def wait_for_event(event):
 # loops to check the socket for incoming data and ends once some events
 # get found
 def wait_for_events():
-    if len(_client._events_stack) > 0:
+    if _client._events:
         return  # as we already have events to handle, no need to wait for more
 
     try:
         while True:
-            sent = None
             try:
-                sent = _client.socket.recv(_client._buffer_size) \
-                    .decode('utf-8')
+                received = _client.socket.recv_into(_client._receive_view)
             except socket.timeout:
-                pass  # timed out so keyboard/system interrupts can be handled,
-                #       hence the while true loop above
+                continue  # timed out so keyboard/system interrupts can be handled,
+                #           hence the while true loop above
             except socket.error as e:
                 error_code.handle_error(
                     error_code.CANNOT_READ_SOCKET, e,
                     'Error reading socket while waiting for events')
 
-            if not sent:
-                continue
-            elif _client._print_io:
-                print(color.text('magenta') + 'FROM SERVER <-- ' + str(
-                    sent) + color.reset())
-
-            split = (_client._received_buffer + sent).split(EOT_CHAR)
-            # the last item will either be "" if the last char was an EOT_CHAR,
-            #   or a partial data we need to buffer anyways
-            _client._received_buffer = split.pop()
-
-            for json_str in reversed(split):
-                try:
-                    parsed = json.loads(json_str)
-                except ValueError as e:
-                    error_code.handle_error(error_code.MALFORMED_JSON, e,
-                                            'Could not parse json ""'.format(
-                                                json_str)
-                                            )
-
-                _client._events_stack.append(parsed)
-
-            if len(_client._events_stack) > 0:
+            # timeouts raise, so nothing read means the server closed the connection
+            if not received:
+                error_code.handle_error(
+                    error_code.DISCONNECTED_UNEXPECTEDLY,
+                    message='The server closed the connection while we were waiting for events')
+
+            sent = _client._receive_view[:received]
+            if _client._print_io:
+                print(color.text('magenta') + 'FROM SERVER <-- ' + bytes(
+                    sent).decode('utf-8', 'replace') + color.reset())
+
+            _client._received_buffer += sent
+            events, _client._scanned = _split_events(
+                _client._received_buffer, _client._scanned)
+
+            if events:
+                _client._events.extend(events)
                 return
     except (KeyboardInterrupt, SystemExit):
         disconnect()
 
 
+# takes every complete frame off the front of buffer and returns them parsed,
+# along with how much of what's left has been scanned for an EOT
+def _split_events(buffer, scanned):
+    # only the bytes that just arrived can hold a new EOT, and frames are
+    # only decoded once complete, so characters split across chunks are
+    # never cut in half
+    frames = []
+    start = 0
+    end = buffer.find(EOT_BYTE, scanned)
+    while end != -1:
+        frames.append(buffer[start:end])
+        start = end + 1
+        end = buffer.find(EOT_BYTE, start)
+
+    del buffer[:start]
+
+    if session.recording:
+        for frame in frames:
+            session.recording.write(session.INBOUND, frame)
+
+    events = []
+    for frame in frames:
+        try:
+            events.append(codec.loads(frame))
+        except ValueError as e:
+            error_code.handle_error(error_code.MALFORMED_JSON, e,
+                                    'Could not parse json "{}"'.format(frame))
+
+    return events, len(buffer)
+
+
 # called via the client run loop when data is sent
 def _auto_handle(event, data=None):
     # the current module, e.g. the Client module that acts as a singleton
@@ -184,14 +322,27 @@ def _auto_handle_delta(data):
 
 
 def _auto_handle_order(data):
+    # the AI thinks on its own thread, this one goes back to reading the
+    # socket and merging deltas, and the reply is sent once it's ready
+    _client._ordering = True
+    _client._order_done.clear()
+    _client._order_thread = threading.Thread(
+        target=_run_order, args=(data,), daemon=True)
+    _client._order_thread.start()
+
+
+def _run_order(data):
     args = deserialize(data['args'], _client.game)
     try:
-        returned = _client.ai._do_order(data['name'], args)
+        returned = _do_order(data['name'], args)
     except:
-        print('esc info', type(sys.exc_info()))
         error_code.handle_error(error_code.AI_ERRORED, sys.exc_info(),
                                 'AI errored executing order "{}"'.format(
-                                    data.name))
+                                    data['name']))
+
+    # the game is over, nobody is waiting for the reply
+    if _client._cancelled:
+        return
 
     send("finished", {
         'orderIndex': data['index'],
@@ -199,6 +350,42 @@ def _auto_handle_order(data):
     })
 
 
+# runs an order on the AI, on whichever thread orders run on, and lets
+# _cancel_order know once it's done
+def _do_order(name, args):
+    try:
+        return _client.ai._do_order(name, args)
+    finally:
+        _client._ordering = False
+        _client._order_done.set()
+
+
+# the reply to the oldest server call still in flight
+def _auto_handle_ran(data):
+    if _client._runs:
+        _client._runs.popleft().set_result(deserialize(data, _client.game))
+
+
+# lets an AI that is still working on an order know the game won't wait for
+# it, and gives it a moment to stop before the AI's end() is called
+def _cancel_order():
+    if not _client._ordering:
+        return
+
+    _client._cancelled = True
+    try:
+        _client.ai.cancel()
+    except:
+        pass
+
+    # the server won't answer the calls it's still waiting on
+    with _client._run_lock:
+        while _client._runs:
+            _client._runs.popleft().set_result(None)
+
+    _client._order_done.wait(CANCEL_TIMEOUT)
+
+
 def _auto_handle_invalid(data):
     try:
         _client.ai.invalid(data['message'])
@@ -208,6 +395,7 @@ def _auto_handle_invalid(data):
 
 
 def _auto_handle_fatal(data):
+    _cancel_order()
     error_code.handle_error(
         error_code.FATAL_EVENT,
         message='Got a fatal event from the server: ' + data['message']
@@ -215,6 +403,8 @@ def _auto_handle_fatal(data):
 
 
 def _auto_handle_over(data):
+    _cancel_order()
+
     won = _client.ai.player.won
     reason = _client.ai.player.reason_won \
         if _client.ai.player.won \
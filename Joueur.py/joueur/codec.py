@@ -0,0 +1,29 @@
+# Codec: the JSON encoding used on the wire. orjson is used when it is
+# installed, otherwise the standard library's json module. Both encode
+# straight to bytes and decode the frames the client reads, bytes or views of
+# its receive buffer.
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson:
+    name = 'orjson'
+
+    def dumps(obj):
+        # non str keys can still come from serializing game state dicts
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    name = 'json'
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(frame):
+        # json only takes bytes from 3.6, and never takes a memoryview
+        return json.loads(bytes(frame).decode('utf-8'))
@@ -1,8 +1,14 @@
 class DeltaMergeable():
     """a game or game object that needs to be delta merged"""
 
+    # game objects declare their fields as __slots__ too, so they have no
+    # per instance __dict__. The deltas the GameManager defers for a field
+    # are kept in _pending_deltas until it's read
+    __slots__ = ('_pending_deltas', '_delta_manager')
+
     def __init__(self):
-        pass
+        self._pending_deltas = None
+        self._delta_manager = None
 
     def _run_on_server(self, function_name, **kwargs):
         import joueur.client # avoid circular imports (sphinx won't build docs otherwise)
@@ -13,3 +19,12 @@ class DeltaMergeable():
 
     def __getitem__(self, key):
         return getattr(self, key)
+
+    def __getattr__(self, key):
+        # only reached when normal lookup fails, e.g. for a field whose deltas the GameManager deferred
+        pending = self._pending_deltas if key != '_pending_deltas' else None
+        if not pending or key not in pending:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, key))
+
+        self._delta_manager._merge_pending(self, key)
+        return getattr(self, key)
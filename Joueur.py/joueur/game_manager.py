@@ -8,12 +8,44 @@ class GameManager():
     def __init__(self, game):
         self.game = game
         self._game_object_classes = game._game_object_classes
+        self._subscriptions = None # class name -> state keys merged eagerly, None to merge everything eagerly
+
+        # class -> server key -> state key, e.g. 'gameObjectName' -> '_game_object_name'
+        self._key_names = {}
+        for cls in list(self._game_object_classes.values()) + [type(game)]:
+            self._key_names[cls] = self._build_key_names(game if cls is type(game) else cls())
 
     def set_constants(self, constants):
         self._server_constants = constants
         self._DELTA_REMOVED = constants['DELTA_REMOVED']
         self._DELTA_LIST_LENGTH = constants['DELTA_LIST_LENGTH']
 
+    ## turns on lazy merging: only the subscribed fields, e.g. {'Game': ['fen']}, are merged as deltas arrive. The rest are kept raw and merged when first read
+    def subscribe(self, subscriptions):
+        self._subscriptions = {}
+        for class_name, fields in subscriptions.items():
+            self._subscriptions[class_name] = _ALWAYS_MERGED | set("_" + field for field in fields)
+
+    ## maps the server's camelCase keys to the private attributes an instance was created with
+    def _build_key_names(self, instance):
+        key_names = {}
+        for name in dir(instance):
+            if not name.startswith('_') or name.startswith('__') or callable(getattr(instance, name)):
+                continue
+
+            # the delta bookkeeping every game object carries, never sent by the server
+            if name in DeltaMergeable.__slots__:
+                continue
+
+            words = name[1:].split('_')
+            key = words[0] + ''.join(word.title() for word in words[1:])
+
+            # only keep names the converter would produce, anything else is translated on demand
+            if camel_case_converter(key) == name[1:]:
+                key_names[key] = name
+
+        return key_names
+
     ## applies a delta state (change in state information) to this game
     def apply_delta_state(self, delta):
         if 'gameObjects' in delta:
@@ -34,8 +66,42 @@ class GameManager():
         else:
             setattr(state, state_key, value)
 
+    ## stores a delta for an unsubscribed field on its object until the field is read
+    def _defer_delta(self, state, state_key, d):
+        pending = state._pending_deltas
+        if pending is None:
+            pending = state._pending_deltas = {}
+            state._delta_manager = self
+
+        if state_key not in pending:
+            # take the field off the instance so reading it falls through to DeltaMergeable.__getattr__
+            value = getattr(state, state_key, _MISSING)
+            if value is not _MISSING:
+                delattr(state, state_key)
+
+            pending[state_key] = (value, [])
+
+        pending[state_key][1].append(d)
+
+    ## merges the deferred deltas of a field, in the order they arrived
+    def _merge_pending(self, state, state_key):
+        value, deltas = state._pending_deltas.pop(state_key)
+
+        if value is not _MISSING:
+            setattr(state, state_key, value)
+
+        for d in deltas:
+            self._merge_member(state, state_key, d)
+
+        if state is not self.game:
+            self.game._game_object_merged(state)
+
     ## recursively merges delta changes to the game.
     def _merge_delta(self, state, delta):
+        if isinstance(state, DeltaMergeable):
+            self._merge_object(state, delta)
+            return
+
         delta_length = -1
         if self._DELTA_LIST_LENGTH in delta:
             delta_length = delta[self._DELTA_LIST_LENGTH]
@@ -47,30 +113,80 @@ class GameManager():
             while len(state) < delta_length: # append elements on the array to make it's size correct.
                 state.append(None)
 
+        is_list = isinstance(state, list)
         for key in delta: # deltas will always be objects when iterating through, arrays just have keys of numbers
-            d = delta[key]
-            state_key = key # array's keys are real numbers, not strings e.g. "1"
-            key_in_state = False
+            # array's keys are real numbers, not strings e.g. "1"
+            self._merge_key(state, int(key) if is_list else key, delta[key])
+
+    ## merges a delta into a game or game object, with its keys translated through the class's table
+    def _merge_object(self, state, delta):
+        cls = type(state)
+        key_names = self._key_names.get(cls)
+        if key_names is None:
+            key_names = self._key_names[cls] = {}
+
+        subscribed = None
+        if self._subscriptions is not None:
+            subscribed = self._subscriptions.get(cls.__name__, _ALWAYS_MERGED)
+
+        for key, d in delta.items():
+            state_key = key_names.get(key)
+            if state_key is None:
+                state_key = key_names[key] = "_" + camel_case_converter(key)
 
-            if isinstance(state, list):
-                state_key = int(key)
-                key_in_state = state_key < len(state)
+            if subscribed is not None and state_key not in subscribed:
+                self._defer_delta(state, state_key, d)
             else:
-                if isinstance(state, DeltaMergeable):
-                    state_key = "_" + camel_case_converter(state_key)
-                key_in_state = state_key in state
-
-            if d == self._DELTA_REMOVED:
-                if key_in_state:
-                    del state[state_key]
-            elif is_game_object_reference(d): # then this is a shallow reference to a game object
-                referenced_object = self.game.get_game_object(d['id'])
-                self._set_member(state, state_key, referenced_object)
-            elif is_object(d) and key_in_state and is_object(state[state_key]):
+                self._merge_member(state, state_key, d)
+
+        if state is not self.game:
+            self.game._game_object_merged(state)
+
+    ## merges the delta for one attribute of a game or game object, looking the attribute up only once
+    def _merge_member(self, state, state_key, d):
+        if d == self._DELTA_REMOVED:
+            if hasattr(state, state_key):
+                delattr(state, state_key)
+        elif is_game_object_reference(d): # then this is a shallow reference to a game object
+            setattr(state, state_key, self.game.get_game_object(d['id']))
+        elif is_object(d):
+            current = getattr(state, state_key, _MISSING)
+
+            if current is not _MISSING and is_object(current):
+                self._merge_delta(current, d)
+            elif current is _MISSING and isinstance(d, dict):
+                setattr(state, state_key, [] if self._DELTA_LIST_LENGTH in d else {})
+                self._merge_delta(getattr(state, state_key), d)
+            elif current is not _MISSING:
+                setattr(state, state_key, d)
+        else:
+            setattr(state, state_key, d)
+
+    ## merges the delta for one key of a list, dict, or object
+    def _merge_key(self, state, state_key, d):
+        if isinstance(state, list):
+            key_in_state = state_key < len(state)
+        else:
+            key_in_state = state_key in state
+
+        if d == self._DELTA_REMOVED:
+            if key_in_state:
+                del state[state_key]
+        elif is_game_object_reference(d): # then this is a shallow reference to a game object
+            referenced_object = self.game.get_game_object(d['id'])
+            self._set_member(state, state_key, referenced_object)
+        elif is_object(d) and key_in_state and is_object(state[state_key]):
+            self._merge_delta(state[state_key], d)
+        elif not key_in_state and is_object(d):
+            if isinstance(d, dict):
+                state[state_key] = [] if self._DELTA_LIST_LENGTH in d else {}
                 self._merge_delta(state[state_key], d)
-            elif not key_in_state and is_object(d):
-                if isinstance(d, dict):
-                    state[state_key] = [] if d in self._DELTA_LIST_LENGTH else {}
-                    self._merge_delta(state[state_key], d)
-            else:
-                self._set_member(state, state_key, d)
+        else:
+            self._set_member(state, state_key, d)
+
+
+# marks a deferred field that did not exist on its object yet
+_MISSING = object()
+
+# ids and the game object table are needed to resolve references, so they are never deferred
+_ALWAYS_MERGED = frozenset(['_id', '_game_object_name', '_game_objects'])
@@ -1,5 +1,6 @@
 import importlib.util
 import joueur.client
+import joueur.session
 import sys
 import joueur.error_code as error_code
 from joueur.game_manager import GameManager
@@ -12,7 +13,21 @@ def run(args):
     args.server = split_server[0]
     args.port = int((len(split_server) == 2 and split_server[1])) or args.port
 
-    joueur.client.connect(args.server, args.port, args.print_io)
+    if args.record:
+        joueur.session.record(args.record)
+
+    if args.replay:
+        # a replay is read like a socket, there is no connection for asyncio to drive
+        joueur.client.connect(args.server, args.port, args.print_io,
+                              args.buffer_size, replay=args.replay)
+    else:
+        if args.use_asyncio:
+            # only imported when asked for, it needs a newer Python than the
+            # rest of the client
+            import joueur.async_client as async_client
+            async_client.install()
+
+        joueur.client.connect(args.server, args.port, args.print_io, args.buffer_size)
 
     joueur.client.send("alias", args.game)
     game_name = joueur.client.wait_for_event("named")
@@ -49,6 +64,8 @@ def run(args):
         )
 
     manager = GameManager(game)
+    if ai.delta_subscriptions is not None:
+        manager.subscribe(ai.delta_subscriptions)
 
     joueur.client.setup(game, ai, manager)
 
@@ -7,36 +7,82 @@ def is_game_object_reference(d):
 def is_object(obj):
     return (isinstance(obj, dict) or isinstance(obj, list)) or isinstance(obj, BaseGameObject)
 
-def serialize(data):
-    if not isinstance(data, (list, dict, BaseGameObject)):
-        return data
+# returned by a handler to look inside a list or dict instead of replacing it
+_WALK = object()
 
-    if isinstance(data, BaseGameObject):
-        return {'id': data.id}
+def _keep(value, game):
+    return value
 
-    serialized = {}
-    for key in data:
-        value = data[key]
-        if is_object(value):
-            serialized[key] = serialize(value)
-        else:
-            serialized[key] = value
-    return serialized
+def _look_inside(value, game):
+    return _WALK
 
-def deserialize(data, game):
-    if not isinstance(data, (list, dict, BaseGameObject)):
-        return data
+def _reference(game_object, game):
+    return {'id': game_object.id}
 
-    if is_game_object_reference(data):
+def _dereference(data, game):
+    if len(data) == 1 and 'id' in data:
         return game.get_game_object(data['id'])
 
-    # else if we got here it's a list or dict
-    deserialized = [None] * len(data) if isinstance(data, list) else {}
-    seq_iter = data.items if isinstance(data, dict) else enumerate(data)
-    for key, value in seq_iter:
-        if is_object(value):
-            deserialized[key] = deserialize(value, game)
+    return _WALK
+
+# type -> handler, filled in for subclasses (e.g. each game's Piece) the first time they are seen
+_serializers = {list: _look_inside, dict: _look_inside, BaseGameObject: _reference}
+_deserializers = {list: _look_inside, dict: _dereference}
+
+def _find_handler(handlers, value):
+    value_type = type(value)
+
+    for base, handler in list(handlers.items()):
+        if isinstance(value, base):
+            handlers[value_type] = handler
+            return handler
+
+    handlers[value_type] = _keep
+    return _keep
+
+def _transform(data, handlers, game):
+    # walks data with an explicit stack, replacing values through handlers.
+    # lists and dicts are only copied when something inside them changed, so
+    # unchanged sub-trees are returned as they were
+    handler = handlers.get(type(data)) or _find_handler(handlers, data)
+    result = handler(data, game)
+    if result is not _WALK:
+        return result
+
+    # frames are [container, remaining items, copy (or None), parent frame, key in parent]
+    stack = [[data, _items(data), None, None, None]]
+    while stack:
+        frame = stack[-1]
+
+        for key, value in frame[1]:
+            handler = handlers.get(type(value)) or _find_handler(handlers, value)
+            result = handler(value, game)
+
+            if result is _WALK:
+                stack.append([value, _items(value), None, frame, key])
+                break
+            elif result is not value:
+                _set_item(frame, key, result)
         else:
-            deserialized[key] = value
+            stack.pop()
+            parent = frame[3]
+
+            if parent is None:
+                return data if frame[2] is None else frame[2]
+            elif frame[2] is not None:
+                _set_item(parent, frame[4], frame[2])
+
+def _items(container):
+    return iter(container.items() if isinstance(container, dict) else enumerate(container))
+
+def _set_item(frame, key, value):
+    if frame[2] is None:
+        frame[2] = dict(frame[0]) if isinstance(frame[0], dict) else list(frame[0])
 
-    return deserialized
+    frame[2][key] = value
+
+def serialize(data):
+    return _transform(data, _serializers, None)
+
+def deserialize(data, game):
+    return _transform(data, _deserializers, game)
@@ -0,0 +1,174 @@
+import collections
+import gzip
+import socket
+import struct
+import threading
+import time
+import joueur.codec as codec
+import joueur.ansi_color_coder as color
+
+# Session: records every frame a client sends and receives, with when it
+# happened, and plays a recording back in place of the socket so a game can be
+# re-run without a server.
+#
+# A recording is a gzip stream of records, each a header followed by the frame
+# without its EOT.
+
+INBOUND = 0
+OUTBOUND = 1
+
+# direction, seconds since the recording started, length of the frame
+_HEADER = struct.Struct('<BdI')
+
+EOT_BYTE = chr(4).encode('utf-8')
+
+# the Recording frames are written to, None when not recording
+recording = None
+
+
+class Recording:
+    def __init__(self, path):
+        self._file = gzip.open(path, 'wb')
+        self._started = time.perf_counter()
+        # frames are sent from the order thread and received on the I/O thread
+        self._lock = threading.Lock()
+
+    def write(self, direction, frame):
+        with self._lock:
+            if self._file:
+                self._file.write(_HEADER.pack(
+                    direction, time.perf_counter() - self._started, len(frame)))
+                self._file.write(frame)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def record(path):
+    global recording
+    recording = Recording(path)
+
+
+def stop():
+    # the client exits with os._exit once the game is over, so the file has
+    # to be closed before then
+    if recording:
+        recording.close()
+
+
+def read(path):
+    """Reads a recording.
+
+    Yields:
+        tuple: (direction, seconds since the recording started, frame) for each frame, in the order they happened.
+    """
+    with gzip.open(path, 'rb') as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+
+            direction, at, length = _HEADER.unpack(header)
+            yield direction, at, f.read(length)
+
+
+class Replay:
+    """Stands in for the client's socket, receiving the frames of a recording instead of the server's.
+
+    Each inbound frame is only given back once the client has sent every
+    frame it sent before it in the recording, so replies and deltas arrive in
+    the same order relative to the client's own events as they did live.
+    """
+
+    def __init__(self, path):
+        self._records = collections.deque(read(path))
+        # the outbound frames of the recording, to compare the client's against
+        self._expected = collections.deque(
+            frame for direction, at, frame in self._records
+            if direction == OUTBOUND)
+        self._sent = 0
+        self._needed = 0
+        self._pending = b''
+        self._timeout = None
+        self._diverged = False
+        self._sent_lock = threading.Condition()
+        self._frames = 0
+        self._started = time.perf_counter()
+        self._closed = False
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def setsockopt(self, *args):
+        pass
+
+    def sendall(self, data):
+        frames = bytes(data).split(EOT_BYTE)[:-1]
+
+        for frame in frames:
+            expected = self._expected.popleft() if self._expected else None
+            if not self._diverged and not _same_event(frame, expected):
+                self._diverged = True
+                print(color.text('yellow') + 'Replay diverged from the recording at: ' + frame.decode(
+                    'utf-8', 'replace') + color.reset())
+
+        with self._sent_lock:
+            self._sent += len(frames)
+            self._sent_lock.notify_all()
+
+    def recv_into(self, view):
+        if not self._pending:
+            self._pending = self._next_frame() + EOT_BYTE
+            self._frames += 1
+
+        received = min(len(view), len(self._pending))
+        view[:received] = self._pending[:received]
+        self._pending = self._pending[received:]
+
+        return received
+
+    def _next_frame(self):
+        while self._records:
+            direction, at, frame = self._records[0]
+
+            if direction == INBOUND:
+                self._records.popleft()
+                return frame
+
+            # the server sent what follows after reading this from the client
+            with self._sent_lock:
+                if not self._sent_lock.wait_for(
+                        lambda: self._sent > self._needed, self._timeout):
+                    raise socket.timeout()
+
+            self._needed += 1
+            self._records.popleft()
+
+        raise ConnectionError('The recording ended before the game did')
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        print('{}Replayed {} frames in {:.3f}s{}'.format(
+            color.text('cyan'),
+            self._frames,
+            time.perf_counter() - self._started,
+            color.reset()
+        ))
+
+
+def _same_event(frame, expected):
+    # the same event, ignoring when it was sent
+    if expected is None:
+        return False
+
+    frame, expected = codec.loads(frame), codec.loads(expected)
+    frame.pop('sentTime', None)
+    expected.pop('sentTime', None)
+
+    return frame == expected
@@ -14,6 +14,10 @@ parser.add_argument('-w, --password', action='store', dest='password', default=N
 parser.add_argument('-r, --session', action='store', dest='session', default='*', help='the requested game session you want to play on the server')
 parser.add_argument('--gameSettings', action='store', dest='game_settings', default=None, help='Any settings for the game server to force. Must be query string formatted (key=value&otherKey=otherValue)')
 parser.add_argument('--aiSettings', action='store', dest='ai_settings', default=None, help='Any settings for the AI. Delimit pairs by an ampersand (key=value&otherKey=otherValue)')
+parser.add_argument('--bufferSize', action='store', dest='buffer_size', type=int, default=65536, help='the number of bytes to read from the socket at a time')
+parser.add_argument('--asyncio', action='store_true', dest='use_asyncio', help='use the asyncio client, which keeps reading the socket while the AI is thinking')
+parser.add_argument('--record', action='store', dest='record', default=None, help='save every frame sent to and received from the server, with timestamps, to this file')
+parser.add_argument('--replay', action='store', dest='replay', default=None, help='play back a file saved with --record instead of connecting to a server')
 parser.add_argument('--printIO', action='store_true', dest='print_io', help='(debugging) print IO through the TCP socket to the terminal')
 
 run(parser.parse_args())